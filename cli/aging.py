@@ -0,0 +1,188 @@
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from store import SECONDS_PER_DAY, StockSelection, to_epoch
+
+
+class DateIndex:
+    """
+    Records sorted by stock date for each warehouse and category.
+
+    Parameters:
+    - stock (ColumnarStock): The store to index.
+
+    Note:
+    Each (warehouse, category) pair keeps two parallel arrays: the epoch
+    dates in ascending order and the positions of their records. Records
+    older than a date are a prefix of each array, found by bisection, and
+    the oldest records of several pairs are merged with a heap, so no
+    query scans the stock. Keeping the arrays sorted when a record changes
+    costs a bisection plus an array insert or delete, which moves the
+    entries after it: O(n) in the size of the pair, not of the stock.
+    """
+
+    def __init__(self, stock):
+        self.stock = stock
+        self.runs = {}
+
+        groups = {}
+        columns = stock.columns
+        removed = stock.removed if stock.removed_count else None
+        for index, key in enumerate(zip(columns["warehouse"], columns["category"])):
+            if removed is not None and removed[index]:
+                continue
+            indices = groups.get(key)
+            if indices is None:
+                indices = groups[key] = []
+            indices.append(index)
+
+        dates = columns["date_of_stock"]
+        for key, indices in groups.items():
+            indices.sort(key=dates.__getitem__)
+            self.runs[key] = (
+                array("q", map(dates.__getitem__, indices)),
+                array("q", indices),
+            )
+
+    def key(self, index):
+        columns = self.stock.columns
+        return columns["warehouse"][index], columns["category"][index]
+
+    def add(self, index):
+        """
+        Index the record at a position, e.g. after it was added or changed.
+
+        The arrays of its pair are shifted from the insertion point, so this
+        costs O(n) in the number of records of the pair.
+        """
+        date = self.stock.columns["date_of_stock"][index]
+        run = self.runs.get(self.key(index))
+        if run is None:
+            run = self.runs[self.key(index)] = (array("q"), array("q"))
+        dates, indices = run
+        # records of the same date stay in stock order
+        position = bisect_left(dates, date)
+        while (
+            position < len(dates)
+            and dates[position] == date
+            and indices[position] < index
+        ):
+            position += 1
+        dates.insert(position, date)
+        indices.insert(position, index)
+
+    def discard(self, index):
+        """Stop indexing the record at a position, before it is changed or removed."""
+        date = self.stock.columns["date_of_stock"][index]
+        key = self.key(index)
+        dates, indices = self.runs[key]
+        position = bisect_left(dates, date)
+        while indices[position] != index:
+            position += 1
+        del dates[position]
+        del indices[position]
+        if not dates:
+            del self.runs[key]
+
+    def select(self, warehouse=None, category=None):
+        """
+        Yield the runs of the matching (warehouse, category) pairs.
+
+        Parameters:
+        - warehouse (int, optional): Only this warehouse.
+        - category (str, optional): Only this category.
+
+        Yields:
+        tuple: The dates and the positions of each matching pair.
+        """
+        code = None
+        if category is not None:
+            code = self.stock.codes["category"].get(category)
+            if code is None:
+                return
+        if warehouse is not None and code is not None:
+            run = self.runs.get((warehouse, code))
+            if run is not None:
+                yield run
+            return
+        for (run_warehouse, run_code), run in self.runs.items():
+            if warehouse is not None and run_warehouse != warehouse:
+                continue
+            if code is not None and run_code != code:
+                continue
+            yield run
+
+    @staticmethod
+    def cutoff(days, reference):
+        # records dated up to the cutoff are in stock for more than `days` days
+        return to_epoch(reference) - (days + 1) * SECONDS_PER_DAY
+
+    def count_older_than(self, days, reference, warehouse=None, category=None):
+        """
+        Count the records in stock for more than a number of days.
+
+        Parameters:
+        - days (int): The number of whole days, as shown by `days_in_stock()`.
+        - reference (datetime): The moment the ages are measured at.
+        - warehouse (int, optional): Only count this warehouse.
+        - category (str, optional): Only count this category.
+
+        Returns:
+        int: The number of records.
+        """
+        cutoff = self.cutoff(days, reference)
+        return sum(
+            bisect_right(dates, cutoff) for dates, _ in self.select(warehouse, category)
+        )
+
+    def older_than(self, days, reference, warehouse=None, category=None, limit=None):
+        """
+        Select the records in stock for more than a number of days.
+
+        Parameters:
+        - days (int): The number of whole days, as shown by `days_in_stock()`.
+        - reference (datetime): The moment the ages are measured at.
+        - warehouse (int, optional): Only select this warehouse.
+        - category (str, optional): Only select this category.
+        - limit (int, optional): The most records selected, the oldest first.
+
+        Returns:
+        StockSelection: The records, oldest first.
+        """
+        if limit is not None and limit < 0:
+            raise ValueError(f"limit must not be negative, got {limit}")
+        cutoff = self.cutoff(days, reference)
+        runs = []
+        for dates, indices in self.select(warehouse, category):
+            stop = bisect_right(dates, cutoff)
+            if limit is not None:
+                stop = min(stop, limit)
+            runs.append(zip(dates[:stop], indices[:stop]))
+        return self.merge(runs, limit)
+
+    def oldest(self, limit, warehouse=None, category=None):
+        """
+        Select the records in stock for the longest time.
+
+        Parameters:
+        - limit (int): The number of records.
+        - warehouse (int, optional): Only select this warehouse.
+        - category (str, optional): Only select this category.
+
+        Returns:
+        StockSelection: At most `limit` records, oldest first.
+        """
+        if limit < 0:
+            raise ValueError(f"limit must not be negative, got {limit}")
+        runs = [
+            zip(dates[:limit], indices[:limit])
+            for dates, indices in self.select(warehouse, category)
+        ]
+        return self.merge(runs, limit)
+
+    def merge(self, runs, limit):
+        merged = heapq.merge(*runs)
+        if limit is not None:
+            merged = islice(merged, limit)
+        return StockSelection(self.stock, array("q", (index for _, index in merged)))
@@ -0,0 +1,336 @@
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+from store import StockSelection, from_epoch
+
+MAX_UNFILLED = 100
+
+
+class Pool:
+    """
+    The units of one item in one warehouse that are not allocated yet.
+
+    Parameters:
+    - warehouse (int): The warehouse number.
+    - dates (array): The epoch stock dates of the units, in ascending order.
+    - records (array): The positions of their records, in the same order.
+
+    Note:
+    Allocated units are cut from either end of the arrays by moving `low`
+    or `high`, so taking the oldest or the newest units costs nothing more
+    than copying their positions.
+    """
+
+    __slots__ = ("warehouse", "dates", "records", "low", "high")
+
+    def __init__(self, warehouse, dates, records):
+        self.warehouse = warehouse
+        self.dates = dates
+        self.records = records
+        self.low = 0
+        self.high = len(records)
+
+    @property
+    def remaining(self):
+        return self.high - self.low
+
+    def oldest_date(self):
+        return self.dates[self.low]
+
+    def newest_date(self):
+        return self.dates[self.high - 1]
+
+    def count_until(self, date):
+        """Count the remaining units dated up to `date`, included."""
+        return bisect_right(self.dates, date, self.low, self.high) - self.low
+
+    def count_since(self, date):
+        """Count the remaining units dated from `date`, included."""
+        return self.high - bisect_left(self.dates, date, self.low, self.high)
+
+    def take_oldest(self, count):
+        start, self.low = self.low, self.low + count
+        return start, self.low
+
+    def take_newest(self, count):
+        stop, self.high = self.high, self.high - count
+        return self.high, stop
+
+
+def dated_records(records):
+    """
+    List the dates and positions of stock records, oldest first.
+
+    Parameters:
+    - records (StockSelection or DatabaseSelection): The records of one
+                                                     item in one warehouse.
+
+    Returns:
+    tuple: The epoch dates and the record positions, as two arrays. Records
+           of the same date stay in stock order. A position is the 0-based
+           index of the record in the stock, whatever the storage backend.
+    """
+    if isinstance(records, StockSelection):
+        dates = records.store.columns["date_of_stock"]
+        positions = sorted(sorted(records.indices), key=dates.__getitem__)
+        return array("q", map(dates.__getitem__, positions)), array("q", positions)
+    # a `DatabaseSelection`
+    rows = records.dated()
+    return (
+        array("q", (date for date, _ in rows)),
+        array("q", (position for _, position in rows)),
+    )
+
+
+def oldest_first(pools, amount):
+    """
+    Take the oldest units of any warehouse first (FIFO).
+
+    Parameters:
+    - pools (list): The `Pool`s that can ship the item, in warehouse order.
+    - amount (int): The number of units to take.
+
+    Returns:
+    list: The pool and the (start, stop) range of the block of units taken
+          from each pool, in warehouse order.
+
+    Note:
+    The date of the last unit taken is found among the `amount` oldest
+    units of each pool, then every pool gives its units up to that date.
+    Units of that very date are taken in warehouse order.
+    """
+    dates = sorted(
+        chain.from_iterable(pool.dates[pool.low : pool.low + amount] for pool in pools)
+    )
+    if len(dates) < amount:
+        return [(pool, pool.take_oldest(pool.remaining)) for pool in pools]
+    last = dates[amount - 1]
+    counts = [pool.count_until(last - 1) for pool in pools]
+    return take(pools, counts, amount, lambda pool: pool.count_until(last), "oldest")
+
+
+def newest_first(pools, amount):
+    """Take the most recent units of any warehouse first (LIFO), see `oldest_first()`."""
+    dates = sorted(
+        chain.from_iterable(
+            pool.dates[max(pool.low, pool.high - amount) : pool.high] for pool in pools
+        ),
+        reverse=True,
+    )
+    if len(dates) < amount:
+        return [(pool, pool.take_newest(pool.remaining)) for pool in pools]
+    last = dates[amount - 1]
+    counts = [pool.count_since(last + 1) for pool in pools]
+    return take(pools, counts, amount, lambda pool: pool.count_since(last), "newest")
+
+
+def take(pools, counts, amount, up_to_last, end):
+    # the units dated `last` fill what `counts` leaves, in warehouse order
+    missing = amount - sum(counts)
+    for number, pool in enumerate(pools):
+        if not missing:
+            break
+        extra = min(up_to_last(pool) - counts[number], missing)
+        counts[number] += extra
+        missing -= extra
+    taken = []
+    for pool, count in zip(pools, counts):
+        if count:
+            block = (
+                pool.take_oldest(count) if end == "oldest" else pool.take_newest(count)
+            )
+            taken.append((pool, block))
+    return taken
+
+
+def fewest_warehouses(pools, amount):
+    """
+    Ship from as few warehouses as possible, oldest units first in each.
+
+    The warehouse holding the most units is used first, so a line is
+    shipped from a single warehouse whenever one can fill it.
+    """
+    taken = []
+    for pool in sorted(pools, key=lambda pool: -pool.remaining):
+        if not amount:
+            break
+        count = min(pool.remaining, amount)
+        taken.append((pool, pool.take_oldest(count)))
+        amount -= count
+    return taken
+
+
+def warehouse_order(pools, amount):
+    """Empty the warehouses in stock order, oldest units first in each."""
+    taken = []
+    for pool in pools:
+        if not amount:
+            break
+        count = min(pool.remaining, amount)
+        taken.append((pool, pool.take_oldest(count)))
+        amount -= count
+    return taken
+
+
+POLICIES = {
+    "fifo": oldest_first,
+    "lifo": newest_first,
+    "fewest-warehouses": fewest_warehouses,
+    "warehouse-order": warehouse_order,
+}
+
+
+class AllocationPlanner:
+    """
+    Allocate order lines to specific stock records across warehouses.
+
+    Parameters:
+    - index (dict): A search index, as returned by `build_search_index()`,
+                    whose postings are the records of each item and
+                    warehouse.
+    - policy (str or function, default="fifo"): A name of `POLICIES`, or a
+                                                function with the same
+                                                signature as `oldest_first()`.
+    - partial (bool, default=True): Allocate what is available when a line
+                                    cannot be filled. Otherwise such a line
+                                    gets nothing.
+    - held (container, optional): The positions of records that cannot be
+                                  allocated, e.g. the records held by the
+                                  order ledger.
+
+    Note:
+    The units of an item are sorted by date the first time the item is
+    ordered and are then consumed from `Pool`s, so a line only costs the
+    units it takes, whatever the size of the stock. A unit is allocated
+    at most once per planner. The plan does not place orders: the units
+    stay available in the order ledger, but the units it already holds are
+    not allocated.
+    """
+
+    def __init__(self, index, policy="fifo", partial=True, held=None):
+        self.index = index
+        self.held = held
+        self.policy = POLICIES[policy] if isinstance(policy, str) else policy
+        self.partial = partial
+        self.pools = {}
+        self.stats = {
+            "lines": 0,
+            "filled": 0,
+            "partial": 0,
+            "unfilled": 0,
+            "requested": 0,
+            "allocated": 0,
+            "seconds": 0.0,
+        }
+        self.unfilled = []
+
+    def pools_for(self, item):
+        pools = self.pools.get(item)
+        if pools is None:
+            postings = self.index.get(item, {})
+            pools = self.pools[item] = [
+                Pool(
+                    warehouse,
+                    *dated_records(
+                        records.without(self.held) if self.held else records
+                    ),
+                )
+                for warehouse, records in postings.items()
+            ]
+        return pools
+
+    def allocate(self, item, amount, warehouse=None):
+        """
+        Allocate units of an item.
+
+        Parameters:
+        - item (str): The "state category" name of the item, in any case.
+        - amount (int): The number of units wanted.
+        - warehouse (int, optional): Only ship from this warehouse.
+
+        Returns:
+        list: One dictionary per block of units taken by the policy, one
+              per warehouse for the `POLICIES`, with the amount, the dates of
+              the oldest and newest units and the positions of their records.
+        """
+        pools = [
+            pool
+            for pool in self.pools_for(item.lower())
+            if pool.remaining and warehouse in (None, pool.warehouse)
+        ]
+        if not self.partial and sum(pool.remaining for pool in pools) < amount:
+            return []
+
+        return [
+            {
+                "warehouse": pool.warehouse,
+                "amount": stop - start,
+                "oldest": from_epoch(pool.dates[start]),
+                "newest": from_epoch(pool.dates[stop - 1]),
+                "records": pool.records[start:stop].tolist(),
+            }
+            for pool, (start, stop) in self.policy(pools, amount)
+        ]
+
+    def plan(self, lines):
+        """
+        Allocate order lines one after the other.
+
+        Parameters:
+        - lines (iterable): Order lines with the keys `order`, `item`,
+                            `amount` and `warehouse`, e.g. read by
+                            `transfer.RecordReader(path, "orders")`.
+
+        Yields:
+        dict: The order line, the amount allocated and missing, and its
+              shipments. `stats` and `unfilled` are updated as lines are
+              planned.
+        """
+        stats = self.stats
+        for line in lines:
+            started = time.perf_counter()
+            shipments = self.allocate(line["item"], line["amount"], line["warehouse"])
+            allocated = sum(shipment["amount"] for shipment in shipments)
+            stats["seconds"] += time.perf_counter() - started
+
+            stats["lines"] += 1
+            stats["requested"] += line["amount"]
+            stats["allocated"] += allocated
+            if allocated == line["amount"]:
+                stats["filled"] += 1
+            else:
+                stats["partial" if allocated else "unfilled"] += 1
+                if len(self.unfilled) < MAX_UNFILLED:
+                    self.unfilled.append(
+                        {
+                            "order": line["order"],
+                            "item": line["item"],
+                            "missing": line["amount"] - allocated,
+                        }
+                    )
+            yield {
+                "order": line["order"],
+                "item": line["item"],
+                "requested": line["amount"],
+                "allocated": allocated,
+                "missing": line["amount"] - allocated,
+                "shipments": shipments,
+            }
+
+    def summary(self):
+        """
+        Summarize the lines planned so far.
+
+        Returns:
+        dict: The number of lines filled, partially filled and unfilled,
+              the units requested and allocated, the time spent allocating,
+              the lines allocated per second and the first `MAX_UNFILLED`
+              lines missing units.
+        """
+        stats = dict(self.stats)
+        seconds = stats["seconds"]
+        stats["seconds"] = round(seconds, 3)
+        stats["lines_per_second"] = round(stats["lines"] / seconds) if seconds else 0
+        stats["unfilled_lines"] = self.unfilled
+        return stats
@@ -0,0 +1,235 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+import query
+from synthetic import generate_personnel, generate_stock
+
+
+def scripted_input(answers, default=""):
+    """
+    Build a replacement for `input()` that replies with prepared answers.
+
+    Parameters:
+    - answers (list): The replies, in order.
+    - default (str, default=""): The reply once `answers` is exhausted.
+
+    Returns:
+    function: A function with the signature of `input()`.
+    """
+    replies = iter(answers)
+
+    def fake_input(prompt=""):
+        return next(replies, default)
+
+    return fake_input
+
+
+def run_scripted(function, answers, *args, **kwargs):
+    """
+    Call an interactive function of `query.py` without a terminal.
+
+    Parameters:
+    - function (function): The function to call.
+    - answers (list): The replies given to its prompts.
+
+    Returns:
+    The result of the function. Its output is discarded.
+    """
+    query.input = scripted_input(answers)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            return function(*args, **kwargs)
+    finally:
+        del query.input
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def measure(operation, repeat):
+    """
+    Time an operation several times.
+
+    Parameters:
+    - operation (function): A function without arguments.
+    - repeat (int): The number of calls.
+
+    Returns:
+    dict: The calls, and the mean, 50th, 90th and 99th percentile and
+          maximum latency in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        operation()
+        samples.append((time.perf_counter() - started) * 1000)
+
+    return {
+        "calls": repeat,
+        "mean_ms": round(sum(samples) / repeat, 3),
+        "p50_ms": round(percentile(samples, 0.50), 3),
+        "p90_ms": round(percentile(samples, 0.90), 3),
+        "p99_ms": round(percentile(samples, 0.99), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def max_rss_mb():
+    """Return the peak resident memory of the process in megabytes."""
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def run_benchmarks(repeat=20, seed=0):
+    """
+    Benchmark the main operations against the data loaded in `query`.
+
+    Parameters:
+    - repeat (int, default=20): The calls of each benchmark.
+    - seed (int, default=0): Seed of the random items, categories and users.
+
+    Returns:
+    dict: The latency statistics of each benchmark.
+    """
+    chooser = random.Random(seed)
+    items = list(query.aggregates.get("search_index")) + ["no such item"]
+    categories = list(query.aggregates.get("numeric_categories"))
+    users = sorted(query.credentials.credentials)
+
+    def rebuild_aggregates():
+        query.aggregates.invalidate()
+        query.aggregates.get("search_index")
+        query.aggregates.get("numeric_categories")
+
+    def count_warehouses():
+        query.aggregates.values.pop("warehouse_counts", None)
+        query.aggregates.get("warehouse_counts")
+
+    def search():
+        run_scripted(query.searching_for_item, [chooser.choice(items), "n"], "bench")
+
+    def browse():
+        category = str(chooser.choice(categories))
+        run_scripted(query.browse_by_category, [category], "bench")
+
+    def list_items():
+        run_scripted(query.lst_of_items, [], "bench", pager=False)
+
+    def authenticate():
+        user_name, password = chooser.choice(users)
+        query.credentials.authenticate(user_name, password)
+
+    benchmarks = {
+        "aggregates_rebuild": rebuild_aggregates,
+        "product_amount_counter": query.product_amount_counter,
+        "warehouse_counts": count_warehouses,
+        "searching_for_item": search,
+        "browse_by_category": browse,
+        "lst_of_items": list_items,
+        "credential_index_build": query.credentials.refresh,
+        "authenticate": authenticate,
+    }
+    return {name: measure(operation, repeat) for name, operation in benchmarks.items()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the median latency of each benchmark next to a saved baseline.
+
+    Parameters:
+    - results (dict): The results of `run_benchmarks()`.
+    - baseline (dict): Results saved by an earlier run.
+    - tolerance (float): The slowdown ratio above which a benchmark regressed.
+
+    Returns:
+    list: The names of the benchmarks that regressed.
+    """
+    regressions = []
+    print(f"{'benchmark':<24}{'p50 ms':>12}{'baseline':>12}{'ratio':>8}")
+    for name, statistics in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["p50_ms"]
+        ratio = statistics["p50_ms"] / before if before else float("inf")
+        flag = ""
+        if ratio > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<24}{statistics['p50_ms']:>12.3f}{before:>12.3f}{ratio:>8.2f}{flag}"
+        )
+    return regressions
+
+
+def main(argv=None):
+    """Load or generate the data, run the benchmarks and report them as JSON."""
+    parser = argparse.ArgumentParser(description="Benchmark the warehouse tool.")
+    parser.add_argument(
+        "--rows", type=int, help="generate this many items instead of using data.py"
+    )
+    parser.add_argument("--warehouses", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=3, help="personnel levels")
+    parser.add_argument("--width", type=int, default=3, help="employees per head")
+    parser.add_argument("--snapshot", help="load the data from a snapshot file")
+    parser.add_argument(
+        "--processes", type=int, help="count the warehouses with worker processes"
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", help="write the results to this file")
+    parser.add_argument("--compare", help="compare with results saved earlier")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=1.2,
+        help="slowdown ratio reported as a regression",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.rows is not None:
+        query.set_data(
+            generate_stock(args.rows, args.warehouses, args.seed),
+            generate_personnel(args.depth, args.width, args.seed),
+        )
+    else:
+        query.load_data(args.snapshot)
+    query.use_processes(args.processes)
+    load_seconds = time.perf_counter() - started
+
+    report = {
+        "config": {
+            "rows": len(query.stock),
+            "warehouses": len(query.aggregates.get("stock_by_warehouse")),
+            "employees": len(query.credentials.names),
+            "processes": args.processes,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "python": sys.version.split()[0],
+        },
+        "load_seconds": round(load_seconds, 3),
+        "max_rss_mb_after_load": max_rss_mb(),
+        "results": run_benchmarks(args.repeat, args.seed),
+        "max_rss_mb": max_rss_mb(),
+    }
+    print(json.dumps(report, indent=2))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(report["results"], baseline["results"], args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import threading
+
+
+class AggregateCache:
+    """
+    Memoize structures derived from the stock until the stock changes.
+
+    Parameters:
+    - stock (ColumnarStock): The store the aggregates are derived from.
+                             Its `version` is compared on every lookup.
+
+    Note:
+    Aggregates are registered by name with a function that builds them.
+    A value is built on the first lookup and then reused until the stock
+    version changes, at which point every cached value is dropped. A value
+    being built by another thread is waited for instead of being built twice.
+    """
+
+    def __init__(self, stock):
+        self.stock = stock
+        self.builders = {}
+        self.values = {}
+        self.locks = {}
+        self.version = stock.version
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, name, builder):
+        """
+        Register a function that builds an aggregate.
+
+        Parameters:
+        - name (str): The name the aggregate is looked up by.
+        - builder (function): A function without arguments returning the value.
+        """
+        self.builders[name] = builder
+        self.values.pop(name, None)
+
+    def get(self, name):
+        """
+        Return an aggregate, building it if it is missing or out of date.
+
+        Parameters:
+        - name (str): The name of a registered aggregate.
+
+        Returns:
+        The cached or freshly built value.
+
+        Note:
+        The returned value is shared by every caller and must not be modified.
+        """
+        if self.version != self.stock.version:
+            self.invalidate()
+
+        if name in self.values:
+            self.hits += 1
+            return self.values[name]
+
+        with self.locks.setdefault(name, threading.Lock()):
+            if name in self.values:
+                self.hits += 1
+                return self.values[name]
+            self.misses += 1
+            value = self.builders[name]()
+            self.values[name] = value
+            return value
+
+    def put(self, name, value):
+        """
+        Cache a value built elsewhere, e.g. loaded from a file.
+
+        Parameters:
+        - name (str): The name of a registered aggregate.
+        - value: The value, which must match the current stock.
+        """
+        if self.version != self.stock.version:
+            self.invalidate()
+        self.values[name] = value
+
+    def advance(self):
+        """
+        Follow the current stock version without dropping the cached values.
+
+        Note:
+        Only for callers that have already updated the cached values to
+        match the change, like `StockMutator`.
+        """
+        self.version = self.stock.version
+
+    def invalidate(self):
+        """Drop every cached value and follow the current stock version."""
+        self.values.clear()
+        self.version = self.stock.version
+
+    def stats(self):
+        """
+        Return the hit and miss counters of the cache.
+
+        Returns:
+        dict: The number of hits and misses, and the stock version cached.
+        """
+        return {"hits": self.hits, "misses": self.misses, "version": self.version}
@@ -0,0 +1,70 @@
+import argparse
+import asyncio
+import sys
+import threading
+
+
+async def relay_output(reader):
+    """Copy everything the server sends to the terminal as it arrives."""
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        sys.stdout.write(data.decode("utf-8", errors="replace"))
+        sys.stdout.flush()
+
+
+def read_lines(loop, lines):
+    """Feed the lines typed by the user to the loop, then None at the end."""
+    for line in iter(sys.stdin.readline, ""):
+        loop.call_soon_threadsafe(lines.put_nowait, line)
+    loop.call_soon_threadsafe(lines.put_nowait, None)
+
+
+async def relay_input(writer):
+    """Send each line typed by the user to the server."""
+    lines = asyncio.Queue()
+    # a daemon thread, so that a pending read does not keep the client open
+    threading.Thread(
+        target=read_lines, args=(asyncio.get_running_loop(), lines), daemon=True
+    ).start()
+    while True:
+        line = await lines.get()
+        if line is None:
+            writer.write_eof()
+            return
+        writer.write(line.encode("utf-8"))
+        await writer.drain()
+
+
+async def run_client(host, port):
+    """
+    Connect to `server.py` and use its menu like the local tool.
+
+    Parameters:
+    - host (str): The address of the server.
+    - port (int): The port of the server.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    output = asyncio.create_task(relay_output(reader))
+    typing = asyncio.create_task(relay_input(writer))
+    await output
+    typing.cancel()
+    writer.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Connect to the warehouse server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(run_client(args.host, args.port))
+    except (KeyboardInterrupt, ConnectionError) as error:
+        if isinstance(error, ConnectionError):
+            print(f"Could not reach the server: {error}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+class CredentialIndex:
+    """
+    A flat index of the nested `personnel` list.
+
+    Parameters:
+    - personnel (list): A list of employee dictionaries, where each one
+                        may hold its subordinates under `head_of`.
+
+    Note:
+    The tree is walked once, without recursion, so its depth is only limited
+    by memory. Logins are then checked with a set lookup and the hierarchy
+    is answered from parent and children tables. The index does not see
+    later changes to `personnel` by itself: call `refresh()` after editing it.
+    """
+
+    def __init__(self, personnel):
+        self.personnel = personnel
+        self.refresh()
+
+    def refresh(self):
+        """Rebuild the index from the current state of the personnel tree."""
+        self.credentials = set()
+        self.names = []
+        self.ids_by_name = {}
+        self.parent = []
+        self.children = []
+
+        # each entry is an employee dictionary and the id of its head
+        stack = [(dct, None) for dct in reversed(self.personnel)]
+        while stack:
+            dct, head = stack.pop()
+            employee = len(self.names)
+            self.names.append(dct["user_name"])
+            self.ids_by_name.setdefault(dct["user_name"], []).append(employee)
+            self.credentials.add((dct["user_name"], dct["password"]))
+            self.parent.append(head)
+            self.children.append([])
+            if head is not None:
+                self.children[head].append(employee)
+            for subordinate in reversed(dct.get("head_of", ())):
+                stack.append((subordinate, employee))
+
+    def authenticate(self, p_user_name, p_password):
+        """
+        Check a user name and password.
+
+        Parameters:
+        - p_user_name (str): The user name to check.
+        - p_password (str): The password to check.
+
+        Returns:
+        bool: True if an employee of any level has this user name and password.
+        """
+        return (p_user_name, p_password) in self.credentials
+
+    def reports_to(self, user_name):
+        """
+        List the employees reporting directly to someone.
+
+        Parameters:
+        - user_name (str): The user name of the head.
+
+        Returns:
+        list: The user names of the direct subordinates, in personnel order.
+              Empty if the user is unknown or heads nobody.
+        """
+        return [
+            self.names[subordinate]
+            for employee in self.ids_by_name.get(user_name, ())
+            for subordinate in self.children[employee]
+        ]
+
+    def chain_of_command(self, user_name):
+        """
+        List the heads of an employee, from the closest one to the top.
+
+        Parameters:
+        - user_name (str): The user name of the employee.
+
+        Returns:
+        list: The user names of the heads. Empty if the user is unknown or at
+              the top level. If several employees share the name, the first
+              one in personnel order is used.
+        """
+        employees = self.ids_by_name.get(user_name)
+        if not employees:
+            return []
+
+        chain = []
+        head = self.parent[employees[0]]
+        while head is not None:
+            chain.append(self.names[head])
+            head = self.parent[head]
+        return chain
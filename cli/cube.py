@@ -0,0 +1,165 @@
+from array import array
+
+AXES = ("warehouse", "category", "state")
+
+
+class CountCube:
+    """
+    The number of records of every warehouse, category and state.
+
+    Parameters:
+    - warehouses (list): The warehouse numbers.
+    - categories (list): The category names.
+    - states (list): The state names.
+
+    Note:
+    The counts are kept in one flat array, warehouse major, so the cell of
+    a warehouse, category and state is at
+    `(warehouse * len(categories) + category) * len(states) + state`.
+    The counts of a warehouse, and of a category within a warehouse, are
+    therefore contiguous slices that are summed without a Python loop.
+    """
+
+    def __init__(self, warehouses, categories, states):
+        self.labels = {
+            "warehouse": list(warehouses),
+            "category": list(categories),
+            "state": list(states),
+        }
+        self.positions = {
+            axis: {label: position for position, label in enumerate(labels)}
+            for axis, labels in self.labels.items()
+        }
+        self.counts = array("q", bytes(8 * self.size(len(self.labels["warehouse"]))))
+
+    @classmethod
+    def from_counts(cls, counts, categories, states):
+        """
+        Build a cube from the counts of each warehouse.
+
+        Parameters:
+        - counts (dict): The counts returned by `sharded.count_by_warehouse()`.
+        - categories (list): Every category name, e.g. in code order.
+        - states (list): Every state name.
+
+        Returns:
+        CountCube: A cube with one warehouse per key of `counts`.
+        """
+        cube = cls(counts, categories, states)
+        for warehouse, products in counts.items():
+            for (state, category), amount in products.items():
+                cube.counts[cube.cell(warehouse, category, state)] = amount
+        return cube
+
+    def size(self, warehouses):
+        return warehouses * len(self.labels["category"]) * len(self.labels["state"])
+
+    def cell(self, warehouse, category, state):
+        positions = self.positions
+        return (
+            positions["warehouse"][warehouse] * len(self.labels["category"])
+            + positions["category"][category]
+        ) * len(self.labels["state"]) + positions["state"][state]
+
+    def covers(self, category, state):
+        """Tell whether a category and a state have a place in the cube."""
+        return (
+            category in self.positions["category"] and state in self.positions["state"]
+        )
+
+    def add(self, warehouse, category, state, delta):
+        """
+        Change the count of one cell.
+
+        Parameters:
+        - warehouse (int): The warehouse number. A new warehouse is appended.
+        - category (str): A category name covered by the cube.
+        - state (str): A state name covered by the cube.
+        - delta (int): The change of the count.
+        """
+        if warehouse not in self.positions["warehouse"]:
+            self.positions["warehouse"][warehouse] = len(self.labels["warehouse"])
+            self.labels["warehouse"].append(warehouse)
+            self.counts.extend(array("q", bytes(8 * self.size(1))))
+        self.counts[self.cell(warehouse, category, state)] += delta
+
+    def block(self, warehouse, category=None):
+        """Return the slice of a warehouse, or of one category within it."""
+        states = len(self.labels["state"])
+        start = self.positions["warehouse"][warehouse] * len(self.labels["category"])
+        if category is None:
+            return self.counts[
+                start * states : (start + len(self.labels["category"])) * states
+            ]
+        start += self.positions["category"][category]
+        return self.counts[start * states : (start + 1) * states]
+
+    def category_totals(self):
+        """
+        Return the number of records of each category.
+
+        Returns:
+        dict: The non-zero totals, in category order.
+        """
+        totals = {}
+        for category in self.labels["category"]:
+            amount = sum(
+                sum(self.block(warehouse, category))
+                for warehouse in self.labels["warehouse"]
+            )
+            if amount:
+                totals[category] = amount
+        return totals
+
+    def crosstab(self, rows, columns, warehouse=None, category=None, state=None):
+        """
+        Count the records for each pair of values of two axes.
+
+        Parameters:
+        - rows (str): The axis of the rows, one of `AXES`.
+        - columns (str): The axis of the columns, another one of `AXES`.
+        - warehouse (int, optional): Only count this warehouse.
+        - category (str, optional): Only count this category.
+        - state (str, optional): Only count this state.
+
+        Returns:
+        dict: A dictionary mapping each row value to a dictionary of column
+              values and their non-zero counts, in axis order.
+        """
+        if rows not in AXES or columns not in AXES or rows == columns:
+            raise ValueError(f"cannot cross {rows} with {columns}")
+        filters = {"warehouse": warehouse, "category": category, "state": state}
+        selected = {}
+        for axis, labels in self.labels.items():
+            value = filters[axis]
+            if value is None:
+                selected[axis] = list(enumerate(labels))
+            elif value in self.positions[axis]:
+                selected[axis] = [(self.positions[axis][value], value)]
+            else:
+                return {}
+
+        states = len(self.labels["state"])
+        categories = len(self.labels["category"])
+        table = {}
+        for warehouse_position, warehouse_label in selected["warehouse"]:
+            for category_position, category_label in selected["category"]:
+                start = (warehouse_position * categories + category_position) * states
+                for state_position, state_label in selected["state"]:
+                    amount = self.counts[start + state_position]
+                    if not amount:
+                        continue
+                    labels = {
+                        "warehouse": warehouse_label,
+                        "category": category_label,
+                        "state": state_label,
+                    }
+                    row = table.setdefault(labels[rows], {})
+                    row[labels[columns]] = row.get(labels[columns], 0) + amount
+
+        row_order = self.positions[rows]
+        column_order = self.positions[columns]
+        return {
+            row: dict(sorted(cells.items(), key=lambda cell: column_order[cell[0]]))
+            for row, cells in sorted(table.items(), key=lambda row: row_order[row[0]])
+        }
@@ -0,0 +1,492 @@
+import argparse
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from itertools import islice
+from store import FIELDS, SECONDS_PER_DAY, from_epoch, to_epoch
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock (
+    id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    category TEXT NOT NULL,
+    warehouse INTEGER NOT NULL,
+    date_of_stock INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+# created once the records are loaded, which is faster than updating them
+INDEXES = """
+CREATE INDEX IF NOT EXISTS stock_warehouse ON stock (warehouse);
+CREATE INDEX IF NOT EXISTS stock_item ON stock (state, category, warehouse);
+CREATE INDEX IF NOT EXISTS stock_category ON stock (category, warehouse, state);
+CREATE INDEX IF NOT EXISTS stock_date ON stock (date_of_stock);
+"""
+COLUMNS = ", ".join(FIELDS)
+BATCH_SIZE = 10_000
+
+
+def write_database(path, stock, personnel, batch_size=BATCH_SIZE):
+    """
+    Store stock records and personnel in an SQLite database.
+
+    Parameters:
+    - path (str): The database file. Records are added to the ones it holds.
+    - stock (iterable): Stock dictionaries, or a `ColumnarStock`.
+    - personnel (list): The nested personnel list.
+    - batch_size (int, default=BATCH_SIZE): The records inserted at once.
+
+    Returns:
+    int: The number of stock records written.
+
+    Note:
+    The records are streamed in batches, so the stock does not have to
+    fit in memory. Dates are stored as epoch seconds.
+    """
+    connection = sqlite3.connect(path)
+    try:
+        connection.executescript(SCHEMA)
+        rows = (
+            (
+                record["state"],
+                record["category"],
+                record["warehouse"],
+                to_epoch(record["date_of_stock"]),
+            )
+            for record in stock
+        )
+        written = 0
+        with connection:
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                connection.executemany(
+                    f"INSERT INTO stock ({COLUMNS}) VALUES (?, ?, ?, ?)", batch
+                )
+                written += len(batch)
+            connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('personnel', ?)",
+                (json.dumps(personnel),),
+            )
+        connection.executescript(INDEXES)
+        connection.execute("ANALYZE")
+    finally:
+        connection.close()
+    return written
+
+
+def open_database(path):
+    """
+    Open a database written by `write_database()`.
+
+    Parameters:
+    - path (str): The database file.
+
+    Returns:
+    tuple: The `DatabaseStock` and the personnel list.
+    """
+    stock = DatabaseStock(path)
+    row = stock.execute("SELECT value FROM meta WHERE key = 'personnel'").fetchone()
+    return stock, json.loads(row[0]) if row else []
+
+
+def decode(row):
+    state, category, warehouse, date = row
+    return {
+        "state": state,
+        "category": category,
+        "warehouse": warehouse,
+        "date_of_stock": from_epoch(date),
+    }
+
+
+class DatabaseSelection:
+    """
+    The records of a `DatabaseStock` matching a condition, read on demand.
+
+    Parameters:
+    - store (DatabaseStock): The store holding the records.
+    - where (str): An SQL condition, e.g. "warehouse = ?".
+    - parameters (tuple): The values of the placeholders of `where`.
+    - size (int, optional): The number of matching records, if known.
+    - order (str, default="id"): The SQL ordering of the records.
+    - limit (int, optional): The most records selected.
+
+    Note:
+    Like a `StockSelection`, a selection supports `len()`, iteration,
+    indexing and slicing, but it holds no record. Iteration streams the
+    records from a cursor. Consecutive `view()` calls continue from the
+    last record read instead of skipping the records before the page.
+    """
+
+    def __init__(self, store, where, parameters, size=None, order="id", limit=None):
+        self.store = store
+        self.where = where
+        self.parameters = tuple(parameters)
+        self.size = size
+        self.order = order
+        self.limit = limit
+        # the position and id of the record after the last page read
+        self.resume = None
+
+    def query(self, columns, start=0, stop=None):
+        if self.limit is not None:
+            stop = self.limit if stop is None else min(stop, self.limit)
+        # a negative limit reads every remaining record
+        count = -1 if stop is None else max(0, stop - start)
+        return self.store.execute(
+            f"SELECT {columns} FROM stock WHERE {self.where} "
+            f"ORDER BY {self.order} LIMIT ? OFFSET ?",
+            self.parameters + (count, start),
+        )
+
+    def __len__(self):
+        if self.size is None:
+            sql = f"SELECT 1 FROM stock WHERE {self.where}"
+            if self.limit is not None:
+                sql += f" LIMIT {int(self.limit)}"
+            self.size = self.store.execute(
+                f"SELECT COUNT(*) FROM ({sql})", self.parameters
+            ).fetchone()[0]
+        return self.size
+
+    def __iter__(self):
+        for row in self.query(COLUMNS):
+            yield decode(row)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            start, stop, step = position.indices(len(self))
+            return list(self.view(start, stop))[::step]
+        if position < 0:
+            position += len(self)
+        row = self.query(COLUMNS, position, position + 1).fetchone()
+        if row is None:
+            raise IndexError("selection index out of range")
+        return decode(row)
+
+    def view(self, start, stop):
+        """
+        Read a range of records.
+
+        Parameters:
+        - start (int): The position of the first record.
+        - stop (int): The position after the last record.
+
+        Returns:
+        list: The records, as dictionaries.
+        """
+        if self.order == "id" and self.resume is not None and self.resume[0] == start:
+            rows = self.store.execute(
+                f"SELECT id, {COLUMNS} FROM stock WHERE ({self.where}) AND id > ? "
+                f"ORDER BY id LIMIT ?",
+                self.parameters + (self.resume[1], max(0, stop - start)),
+            ).fetchall()
+        else:
+            rows = self.query(f"id, {COLUMNS}", start, stop).fetchall()
+        if rows:
+            self.resume = (start + len(rows), rows[-1][0])
+        return [decode(row[1:]) for row in rows]
+
+    def without(self, positions):
+        """
+        Leave records out of the selection, see `StockSelection.without()`.
+
+        Returns:
+        DatabaseSelection: A new selection of the other records, in order.
+        """
+        return DatabaseSelection(
+            self.store,
+            f"({self.where}) AND id NOT IN (SELECT value + 1 FROM json_each(?))",
+            self.parameters + (json.dumps(list(positions)),),
+            order=self.order,
+            limit=self.limit,
+        )
+
+    def epochs(self):
+        """Yield the stock date of each record as epoch seconds."""
+        for (date,) in self.query("date_of_stock"):
+            yield date
+
+    def dated(self):
+        """
+        Read the stock date and position of every record, oldest first.
+
+        Returns:
+        list: (epoch date, position) pairs, where the position is the 0-based
+              index of the record in the stock, as in a `StockSelection`.
+              Records of the same date are in stock order.
+        """
+        # ids are numbered from 1 in insertion order and never deleted
+        return self.store.execute(
+            f"SELECT date_of_stock, id - 1 FROM stock WHERE {self.where} "
+            f"ORDER BY date_of_stock, id",
+            self.parameters,
+        ).fetchall()
+
+
+class DatabaseSearchIndex(Mapping):
+    """
+    A read-only inverted index of the item names of a `DatabaseStock`.
+
+    Parameters:
+    - store (DatabaseStock): The indexed store.
+
+    Note:
+    Only the distinct names are kept in memory. Looking a name up returns
+    a dictionary of warehouse numbers and `DatabaseSelection`s, like the
+    postings of `build_search_index()`.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.names = {}
+        for state, category in store.execute(
+            "SELECT state, category FROM stock GROUP BY state, category "
+            "ORDER BY MIN(id)"
+        ):
+            name = f"{state} {category}".lower()
+            self.names.setdefault(name, []).append((state, category))
+
+    def __getitem__(self, name):
+        # names differing only in case share the postings, as in memory
+        pairs = self.names[name]
+        match = " OR ".join(["(state = ? AND category = ?)"] * len(pairs))
+        parameters = tuple(value for pair in pairs for value in pair)
+        order = self.store.warehouse_order()
+        sizes = sorted(
+            self.store.execute(
+                f"SELECT warehouse, COUNT(*) FROM stock WHERE {match} "
+                f"GROUP BY warehouse",
+                parameters,
+            ),
+            key=lambda row: order[row[0]],
+        )
+        return {
+            warehouse: DatabaseSelection(
+                self.store,
+                f"({match}) AND warehouse = ?",
+                parameters + (warehouse,),
+                size,
+            )
+            for warehouse, size in sizes
+        }
+
+    def __contains__(self, name):
+        return name in self.names
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class DatabaseDateIndex:
+    """
+    Stock age queries of a `DatabaseStock`, with the API of `aging.DateIndex`.
+
+    Parameters:
+    - store (DatabaseStock): The store to query.
+
+    Note:
+    The queries read the `date_of_stock` index of the database in date
+    order and stop after the records they need.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    @staticmethod
+    def condition(warehouse, category, cutoff=None):
+        clauses = []
+        parameters = []
+        if cutoff is not None:
+            clauses.append("date_of_stock <= ?")
+            parameters.append(cutoff)
+        if warehouse is not None:
+            clauses.append("warehouse = ?")
+            parameters.append(warehouse)
+        if category is not None:
+            clauses.append("category = ?")
+            parameters.append(category)
+        return " AND ".join(clauses) or "1", parameters
+
+    def count_older_than(self, days, reference, warehouse=None, category=None):
+        cutoff = to_epoch(reference) - (days + 1) * SECONDS_PER_DAY
+        where, parameters = self.condition(warehouse, category, cutoff)
+        return len(DatabaseSelection(self.store, where, parameters))
+
+    def older_than(self, days, reference, warehouse=None, category=None, limit=None):
+        cutoff = to_epoch(reference) - (days + 1) * SECONDS_PER_DAY
+        where, parameters = self.condition(warehouse, category, cutoff)
+        return DatabaseSelection(
+            self.store, where, parameters, order="date_of_stock, id", limit=limit
+        )
+
+    def oldest(self, limit, warehouse=None, category=None):
+        where, parameters = self.condition(warehouse, category)
+        return DatabaseSelection(
+            self.store, where, parameters, order="date_of_stock, id", limit=limit
+        )
+
+
+class DatabaseStock:
+    """
+    A stock store kept in an SQLite database instead of memory.
+
+    Parameters:
+    - path (str): A database written by `write_database()`.
+
+    Note:
+    The store has the read-only interface of `ColumnarStock` that the query
+    functions use: `len()`, iteration, indexing by position, `group_by()`,
+    `count_by()` and the `dictionaries` of the text fields. Groups are `DatabaseSelection`s
+    reading their records through the indexes of the database, and
+    `aggregate_builders()` replaces the in-memory aggregates that would
+    hold every record. Each thread uses its own read-only connection.
+    """
+
+    version = 0
+    removed_count = 0
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.size = None
+        self.order = None
+        self.dictionaries = {
+            field: [
+                value
+                for (value,) in self.execute(
+                    f"SELECT {field} FROM stock GROUP BY {field} ORDER BY MIN(id)"
+                )
+            ]
+            for field in ("state", "category")
+        }
+
+    def execute(self, sql, parameters=()):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+            )
+            self.local.connection = connection
+        return connection.execute(sql, parameters)
+
+    def warehouse_order(self):
+        if self.order is None:
+            self.order = {
+                warehouse: position
+                for position, warehouse in enumerate(self.group_by("warehouse"))
+            }
+        return self.order
+
+    def group_by(self, field):
+        """
+        Group the records by the value of a field.
+
+        Parameters:
+        - field (str): "state", "category" or "warehouse".
+
+        Returns:
+        dict: A dictionary mapping each value, in order of first appearance,
+              to a `DatabaseSelection` of its records.
+        """
+        if field not in FIELDS:
+            raise KeyError(field)
+        return {
+            value: DatabaseSelection(self, f"{field} = ?", (value,), size)
+            for value, size in self.execute(
+                f"SELECT {field}, COUNT(*) FROM stock GROUP BY {field} "
+                f"ORDER BY MIN(id)"
+            )
+        }
+
+    def count_by(self, field):
+        """
+        Count the records for each value of a field.
+
+        Parameters:
+        - field (str): "state", "category" or "warehouse".
+
+        Returns:
+        dict: A dictionary mapping each value, in order of first appearance,
+              to its number of records.
+        """
+        return {value: len(group) for value, group in self.group_by(field).items()}
+
+    def count_by_warehouse(self):
+        """
+        Count the records of each warehouse, state and category.
+
+        Returns:
+        dict: The same counts as `sharded.count_by_warehouse()`.
+        """
+        order = self.warehouse_order()
+        rows = self.execute(
+            "SELECT warehouse, state, category, COUNT(*), MIN(id) FROM stock "
+            "GROUP BY warehouse, state, category"
+        ).fetchall()
+        rows.sort(key=lambda row: (order[row[0]], row[4]))
+        warehouses = {}
+        for warehouse, state, category, amount, _ in rows:
+            warehouses.setdefault(warehouse, {})[(state, category)] = amount
+        return warehouses
+
+    def aggregate_builders(self):
+        """
+        Return the aggregates this store computes itself.
+
+        Returns:
+        dict: Builders to register in an `AggregateCache`, by name.
+        """
+        return {
+            "search_index": lambda: DatabaseSearchIndex(self),
+            "warehouse_counts": self.count_by_warehouse,
+            "date_index": lambda: DatabaseDateIndex(self),
+        }
+
+    def __len__(self):
+        if self.size is None:
+            self.size = self.execute("SELECT COUNT(*) FROM stock").fetchone()[0]
+        return self.size
+
+    def __iter__(self):
+        for row in self.execute(f"SELECT {COLUMNS} FROM stock ORDER BY id"):
+            yield decode(row)
+
+    def __getitem__(self, position):
+        # ids are numbered from 1, see `DatabaseSelection.dated()`
+        row = self.execute(
+            f"SELECT {COLUMNS} FROM stock WHERE id = ?", (position + 1,)
+        ).fetchone()
+        if row is None:
+            raise IndexError("stock index out of range")
+        return decode(row)
+
+
+def main(argv=None):
+    """Store the stock and personnel of data.py, or of a snapshot, in a database."""
+    parser = argparse.ArgumentParser(
+        description="Store the stock and personnel in an SQLite database."
+    )
+    parser.add_argument("output", help="the database file to write")
+    parser.add_argument("--snapshot", help="read a snapshot instead of data.py")
+    args = parser.parse_args(argv)
+
+    if args.snapshot is None:
+        from data import stock, personnel
+    else:
+        from snapshot import load_snapshot
+
+        stock, personnel = load_snapshot(args.snapshot)
+
+    rows = write_database(args.output, stock, personnel)
+    print(f"Wrote {rows} items to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+CLOSE = object()
+
+
+class JournalWriter:
+    """
+    Append journal entries to a JSON Lines file from a background thread.
+
+    Parameters:
+    - path (str): The journal file. Entries are appended to it.
+    - batch_size (int, default=256): The most entries written at once.
+    - flush_interval (float, default=1.0): The longest an entry waits, in
+                                           seconds, before it is written.
+
+    Note:
+    `append()` only queues the entry, so recording an action never waits
+    for the disk. The writer thread gathers the entries arriving within
+    `flush_interval` and writes them with one write and one fsync. A crash
+    can lose at most the entries of the last `flush_interval`.
+    """
+
+    def __init__(self, path, batch_size=256, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.file = open(path, "a", encoding="utf-8")
+        self.queue = queue.SimpleQueue()
+        self.written = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def append(self, entry):
+        """
+        Queue an entry to be written.
+
+        Parameters:
+        - entry (dict): A JSON serializable entry.
+        """
+        self.queue.put(entry)
+
+    def run(self):
+        closing = False
+        while not closing:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not CLOSE:
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        batch.append(self.queue.get(timeout=timeout))
+                    else:
+                        batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is CLOSE:
+                closing = True
+                batch.pop()
+            if batch:
+                self.write(batch)
+
+    def write(self, batch):
+        self.file.write("".join(json.dumps(entry) + "\n" for entry in batch))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.written += len(batch)
+
+    def close(self):
+        """Write the queued entries and close the file."""
+        if self.thread.is_alive():
+            self.queue.put(CLOSE)
+            self.thread.join()
+        self.file.close()
+
+
+class SessionJournal:
+    """
+    Keep the latest actions of one session, and log every action.
+
+    Parameters:
+    - user (str): The name of the user of the session.
+    - writer (JournalWriter, optional): Where every entry is appended.
+                                        If not provided, entries are only
+                                        kept in memory.
+    - capacity (int, default=1000): The number of entries kept in memory.
+                                    Older entries are dropped.
+
+    Note:
+    Each entry records the operation, e.g. "search", the action as shown
+    to the user, the user, the time it started as epoch seconds, its
+    duration in seconds and any extra details, e.g. the amount ordered.
+    """
+
+    def __init__(self, user, writer=None, capacity=1000):
+        self.user = user
+        self.writer = writer
+        self.entries = deque(maxlen=capacity)
+        self.recorded = Counter()
+
+    def record(self, operation, action, started=None, **details):
+        """
+        Record an action.
+
+        Parameters:
+        - operation (str): The kind of action, e.g. "list" or "order".
+        - action (str): The description of the action.
+        - started (float, optional): The `time.perf_counter()` value when the
+                                     action started. If not provided, the
+                                     action took no time.
+        - details: Additional JSON serializable fields of the entry.
+
+        Returns:
+        dict: The entry.
+        """
+        seconds = 0.0 if started is None else time.perf_counter() - started
+        entry = {
+            "time": round(time.time() - seconds, 6),
+            "user": self.user,
+            "operation": operation,
+            "action": action,
+            "seconds": round(seconds, 6),
+            **details,
+        }
+        self.entries.append(entry)
+        self.recorded[operation] += 1
+        if self.writer is not None:
+            self.writer.append(entry)
+        return entry
+
+    def numbered(self, exclude=()):
+        """
+        Yield the entries kept in memory with their number in the session.
+
+        Parameters:
+        - exclude (iterable, optional): Operations whose entries are neither
+                                        yielded nor numbered, e.g. ("order",).
+
+        Yields:
+        tuple: The number, counted from 1 even when older entries were
+               dropped, and the entry.
+        """
+        entries = [entry for entry in self.entries if entry["operation"] not in exclude]
+        counted = sum(self.recorded.values()) - sum(
+            self.recorded[operation] for operation in exclude
+        )
+        yield from enumerate(entries, start=counted - len(entries) + 1)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+
+def read_journal(path, user=None, operation=None, since=None):
+    """
+    Read the entries of a journal file.
+
+    Parameters:
+    - path (str): The journal file.
+    - user (str, optional): Only yield the entries of this user.
+    - operation (str, optional): Only yield the entries of this operation.
+    - since (float, optional): Only yield the entries started at or after
+                               this time, in epoch seconds.
+
+    Yields:
+    dict: The matching entries, in the order they were written.
+
+    Note:
+    The file is read in large blocks and lines that cannot match `user` or
+    `operation` are skipped before they are decoded.
+    """
+    needles = []
+    if user is not None:
+        needles.append(f'"user": {json.dumps(user)}'.encode())
+    if operation is not None:
+        needles.append(f'"operation": {json.dumps(operation)}'.encode())
+
+    with open(path, "rb", buffering=1 << 20) as file:
+        for line in file:
+            if not all(needle in line for needle in needles):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # a line cut short by a crash
+                continue
+            if user is not None and entry.get("user") != user:
+                continue
+            if operation is not None and entry.get("operation") != operation:
+                continue
+            if since is not None and entry["time"] < since:
+                continue
+            yield entry
+
+
+def summarize(entries):
+    """
+    Summarize journal entries.
+
+    Parameters:
+    - entries (iterable): Entries as yielded by `read_journal()`.
+
+    Returns:
+    dict: The number of entries, the number of each operation with its
+          total and maximum duration, and the number of entries per user.
+    """
+    operations = {}
+    users = {}
+    count = 0
+    for entry in entries:
+        count += 1
+        summary = operations.get(entry["operation"])
+        if summary is None:
+            summary = operations[entry["operation"]] = {
+                "count": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+            }
+        summary["count"] += 1
+        summary["seconds"] = round(summary["seconds"] + entry["seconds"], 6)
+        summary["max_seconds"] = max(summary["max_seconds"], entry["seconds"])
+        users[entry["user"]] = users.get(entry["user"], 0) + 1
+    return {"entries": count, "operations": operations, "users": users}
+
+
+def main(argv=None):
+    """Print the entries of a journal file, or their summary, as JSON."""
+    parser = argparse.ArgumentParser(description="Read a session journal.")
+    parser.add_argument("file")
+    parser.add_argument("--user")
+    parser.add_argument("--operation", help='e.g. "order" or "search"')
+    parser.add_argument("--since", type=float, help="epoch seconds")
+    parser.add_argument("--summary", action="store_true")
+    args = parser.parse_args(argv)
+
+    entries = read_journal(args.file, args.user, args.operation, args.since)
+    if args.summary:
+        print(json.dumps(summarize(entries), indent=2))
+    else:
+        for entry in entries:
+            sys.stdout.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    main()
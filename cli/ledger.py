@@ -0,0 +1,364 @@
+import argparse
+import random
+import threading
+import time
+from array import array
+from allocation import dated_records
+
+
+class Reservation:
+    """
+    Units of an item held for one order until it is committed or released.
+
+    Parameters:
+    - parts (dict): The positions of the records taken from each
+                    (item, warehouse) pair.
+    """
+
+    __slots__ = ("parts", "state")
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.state = "reserved"
+
+    @property
+    def amount(self):
+        return sum(len(positions) for positions in self.parts.values())
+
+
+class ReservationLedger:
+    """
+    Track the units of every item and warehouse that can still be ordered.
+
+    Parameters:
+    - availability (dict): The number of units of each (item, warehouse)
+                           pair, where the item is the lowercased
+                           "state category" name.
+    - postings (function): Returns the records of an item in a warehouse,
+                           e.g. the postings of a search index, as a
+                           `StockSelection` or a `DatabaseSelection`.
+    - stripes (int, default=64): The number of locks the pairs are spread
+                                 over.
+
+    Note:
+    An order first reserves units, which removes them from the available
+    amount, then commits or releases the reservation. A unit is a stock
+    record: the oldest records of a pair that are not held yet are
+    reserved first, and `held` maps the position of every record reserved
+    or committed to its pair, so the records can be left out wherever the
+    stock is shown. Each pair is guarded by one of `stripes` locks, so
+    orders on different items rarely wait for each other. When an order
+    spans several warehouses their locks are always taken in the same
+    order, which rules out deadlocks.
+    """
+
+    def __init__(self, availability, postings, stripes=64):
+        self.available = {}
+        self.committed = {}
+        self.warehouses = {}
+        for (item, warehouse), amount in availability.items():
+            self.available[(item, warehouse)] = amount
+            self.committed[(item, warehouse)] = 0
+            self.warehouses.setdefault(item, []).append(warehouse)
+        self.postings = postings
+        self.held = {}
+        # the positions of each pair, oldest first, and how many of them
+        # are known to be held, built on the first reservation of the pair
+        self.queues = {}
+        self.cursors = {}
+        self.locks = [threading.Lock() for _ in range(stripes)]
+
+    @classmethod
+    def from_index(cls, index, stripes=64, postings=None):
+        """
+        Build a ledger from the units listed in a search index.
+
+        Parameters:
+        - index (dict): An index as returned by `build_search_index()`.
+        - stripes (int, default=64): The number of locks.
+        - postings (function, optional): Returns the records of an item in
+                                         a warehouse. If not provided, they
+                                         are read from `index`.
+
+        Returns:
+        ReservationLedger: A ledger with every record available once.
+        """
+        availability = {}
+        for item, postings_ in index.items():
+            for warehouse, records in postings_.items():
+                availability[(item, warehouse)] = len(records)
+        if postings is None:
+
+            def postings(item, warehouse):
+                return index.get(item, {}).get(warehouse, ())
+
+        return cls(availability, postings, stripes)
+
+    def locks_for(self, keys):
+        stripes = sorted({hash(key) % len(self.locks) for key in keys})
+        return [self.locks[stripe] for stripe in stripes]
+
+    def available_amount(self, item, warehouse=None):
+        """
+        Return how many units of an item can still be reserved.
+
+        Parameters:
+        - item (str): The "state category" name of the item, in any case.
+        - warehouse (int, optional): Only count this warehouse.
+
+        Returns:
+        int: The available amount.
+        """
+        item = item.lower()
+        if warehouse is not None:
+            return self.available.get((item, warehouse), 0)
+        return sum(
+            self.available[(item, warehouse)]
+            for warehouse in self.warehouses.get(item, ())
+        )
+
+    def take(self, key, amount):
+        """Hold the `amount` oldest records of a pair that are not held, under its lock."""
+        queue = self.queues.get(key)
+        if queue is None:
+            records = self.postings(*key)
+            queue = dated_records(records)[1] if len(records) else array("q")
+            self.queues[key] = queue
+            self.cursors[key] = 0
+        held = self.held
+        taken = []
+        position = self.cursors[key]
+        while len(taken) < amount and position < len(queue):
+            index = queue[position]
+            position += 1
+            if index not in held:
+                held[index] = key
+                taken.append(index)
+        self.cursors[key] = position
+        return taken
+
+    def reserve(self, item, amount, warehouse=None, partial=False):
+        """
+        Atomically hold units of an item.
+
+        Parameters:
+        - item (str): The "state category" name of the item, in any case.
+        - amount (int): The number of units wanted.
+        - warehouse (int, optional): Only take units from this warehouse.
+                                     If not provided, the warehouses are
+                                     used in stock order.
+        - partial (bool, default=False): Reserve what is available when
+                                         it is less than `amount`.
+
+        Returns:
+        Reservation: The units held, or None if nothing could be reserved.
+        """
+        item = item.lower()
+        if warehouse is None:
+            keys = [(item, number) for number in self.warehouses.get(item, ())]
+        else:
+            keys = [(item, warehouse)]
+        if amount <= 0 or not keys:
+            return None
+
+        locks = self.locks_for(keys)
+        for lock in locks:
+            lock.acquire()
+        try:
+            available = sum(self.available.get(key, 0) for key in keys)
+            if available == 0 or (available < amount and not partial):
+                return None
+            remaining = min(amount, available)
+            parts = {}
+            for key in keys:
+                wanted = min(remaining, self.available.get(key, 0))
+                if wanted:
+                    taken = self.take(key, wanted)
+                    if taken:
+                        self.available[key] -= len(taken)
+                        parts[key] = taken
+                        remaining -= len(taken)
+                if not remaining:
+                    break
+            if not parts or (remaining and not partial):
+                # fewer records than counted, e.g. after a failed change
+                self.restore(parts)
+                return None
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+        return Reservation(parts)
+
+    def commit(self, reservation):
+        """
+        Turn a reservation into an order. The units are not available again.
+
+        Parameters:
+        - reservation (Reservation): A reservation returned by `reserve()`.
+        """
+        self.settle(reservation, "committed")
+
+    def release(self, reservation):
+        """
+        Cancel a reservation and make its units available again.
+
+        Parameters:
+        - reservation (Reservation): A reservation returned by `reserve()`.
+        """
+        self.settle(reservation, "released")
+
+    def settle(self, reservation, state):
+        locks = self.locks_for(reservation.parts)
+        for lock in locks:
+            lock.acquire()
+        try:
+            if reservation.state != "reserved":
+                raise ValueError(f"reservation already {reservation.state}")
+            if state == "committed":
+                for key, positions in reservation.parts.items():
+                    self.committed[key] += len(positions)
+            else:
+                self.restore(reservation.parts)
+            reservation.state = state
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def restore(self, parts):
+        for positions in parts.values():
+            for index in positions:
+                # the pair of a record changes if the record is moved
+                key = self.held.pop(index, None)
+                if key is not None:
+                    self.available[key] += 1
+                    self.cursors[key] = 0
+
+    def adjust(self, item, warehouse, delta, index=None):
+        """
+        Add or remove units of an item after the stock itself changed.
+
+        Parameters:
+        - item (str): The "state category" name of the item, in any case.
+        - warehouse (int): The warehouse of the units.
+        - delta (int): The number of units added, negative when removed.
+                       The available amount never goes below zero.
+        - index (int, optional): The position of the record added or
+                                 removed. A held record stays held, and
+                                 follows the record when it is moved.
+        """
+        key = (item.lower(), warehouse)
+        with self.locks_for([key])[0]:
+            if key not in self.available:
+                self.available[key] = 0
+                self.committed[key] = 0
+                self.warehouses.setdefault(key[0], []).append(warehouse)
+            # the records of the pair are listed again on the next reservation
+            self.queues.pop(key, None)
+            if index is not None and index in self.held:
+                # None while the record is out of the stock
+                self.held[index] = key if delta > 0 else None
+                return
+            self.available[key] = max(0, self.available[key] + delta)
+
+    def order(self, item, amount, partial=False):
+        """
+        Reserve and commit units of an item in one step.
+
+        Parameters:
+        - item (str): The "state category" name of the item, in any case.
+        - amount (int): The number of units wanted.
+        - partial (bool, default=False): Order what is available when it is
+                                         less than `amount`.
+
+        Returns:
+        int: The number of units ordered, 0 if the order was refused.
+        """
+        reservation = self.reserve(item, amount, partial=partial)
+        if reservation is None:
+            return 0
+        self.commit(reservation)
+        return reservation.amount
+
+
+def stress_test(ledger, threads=8, orders_per_thread=10000, seed=0):
+    """
+    Place single unit orders on random items from many threads at once.
+
+    Parameters:
+    - ledger (ReservationLedger): The ledger to order from.
+    - threads (int, default=8): The number of concurrent clerks.
+    - orders_per_thread (int, default=10000): The orders placed by each one.
+    - seed (int, default=0): Seed of the random item choice.
+
+    Returns:
+    dict: The orders accepted and refused, the orders per second, and
+          whether every unit is still accounted for afterwards.
+    """
+    items = list(ledger.warehouses)
+    initial = sum(ledger.available.values()) + sum(ledger.committed.values())
+    accepted = [0] * threads
+    start_barrier = threading.Barrier(threads + 1)
+
+    def clerk(number):
+        chooser = random.Random(seed + number)
+        choices = [chooser.choice(items) for _ in range(orders_per_thread)]
+        start_barrier.wait()
+        for item in choices:
+            if ledger.order(item, 1):
+                accepted[number] += 1
+
+    workers = [threading.Thread(target=clerk, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    orders = threads * orders_per_thread
+    final = sum(ledger.available.values()) + sum(ledger.committed.values())
+    return {
+        "threads": threads,
+        "orders": orders,
+        "accepted": sum(accepted),
+        "refused": orders - sum(accepted),
+        "seconds": round(elapsed, 3),
+        "orders_per_second": round(orders / elapsed),
+        # every unit ordered is a distinct record
+        "consistent": final == initial
+        and sum(ledger.committed.values()) == sum(accepted)
+        and len(ledger.held) == sum(accepted),
+    }
+
+
+def main(argv=None):
+    """Run `stress_test()` against the stock of data.py, or a synthetic one."""
+    parser = argparse.ArgumentParser(description="Stress test the order ledger.")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--orders", type=int, default=10000, help="per thread")
+    parser.add_argument(
+        "--rows",
+        type=int,
+        help="order from this many synthetic records instead of data.py",
+    )
+    parser.add_argument("--stripes", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    import query
+
+    if args.rows is None:
+        query.load_data()
+    else:
+        from synthetic import generate_personnel, generate_stock
+
+        query.set_data(generate_stock(args.rows), generate_personnel())
+    ledger = ReservationLedger.from_index(
+        query.aggregates.get("search_index"), args.stripes
+    )
+    print(stress_test(ledger, args.threads, args.orders))
+
+
+if __name__ == "__main__":
+    main()
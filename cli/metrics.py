@@ -0,0 +1,222 @@
+import cProfile
+import functools
+import io
+import json
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# bucket `n` holds the latencies below 2 ** n microseconds
+BUCKETS = 40
+
+
+class Histogram:
+    """
+    Summarize the latencies of one operation in power of two buckets.
+
+    Note:
+    Memory does not grow with the number of calls. Percentiles are
+    estimated from the upper bound of the bucket they fall in.
+    """
+
+    __slots__ = ("counts", "calls", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.calls = 0
+        self.total = 0.0
+        self.minimum = float("inf")
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        microseconds = seconds * 1_000_000
+        bucket = min(BUCKETS - 1, int(microseconds).bit_length())
+        self.counts[bucket] += 1
+        self.calls += 1
+        self.total += seconds
+        self.minimum = min(self.minimum, seconds)
+        self.maximum = max(self.maximum, seconds)
+
+    def percentile(self, fraction):
+        """Return the upper bound, in milliseconds, of the `fraction` quantile."""
+        rank = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(2**bucket / 1000, self.maximum * 1000)
+        return self.maximum * 1000
+
+    def report(self):
+        return {
+            "calls": self.calls,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total * 1000 / self.calls, 3),
+            "min_ms": round(self.minimum * 1000, 3),
+            "max_ms": round(self.maximum * 1000, 3),
+            "p50_ms": round(self.percentile(0.50), 3),
+            "p90_ms": round(self.percentile(0.90), 3),
+            "p99_ms": round(self.percentile(0.99), 3),
+            "buckets": [
+                [2**bucket / 1000, count]
+                for bucket, count in enumerate(self.counts)
+                if count
+            ],
+        }
+
+
+class Metrics:
+    """
+    Collect latency histograms and counters, and optionally a profile.
+
+    Note:
+    Collection is off until `enable()` is called, and the timers then only
+    cost a clock read. Every thread records into the same histograms. The
+    profile covers the thread that enabled it.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.started = None
+
+    def enable(self, profile=False):
+        """
+        Start collecting.
+
+        Parameters:
+        - profile (bool, default=False): Also run `cProfile` until `report()`.
+        """
+        self.enabled = True
+        self.started = time.time()
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds)
+
+    def count(self, name, amount=1):
+        """
+        Increase a counter.
+
+        Parameters:
+        - name (str): The name of the counter.
+        - amount (int, default=1): The increase.
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the body of a `with` statement.
+
+        Parameters:
+        - name (str): The histogram the latency is added to, e.g. "phase.output".
+        """
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def timed(self, name):
+        """
+        Decorate a function so that each call is timed, see `timer()`.
+
+        Parameters:
+        - name (str): The histogram the latencies are added to.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapped_func(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - started)
+
+            return wrapped_func
+
+        return decorator
+
+    def profile_report(self, limit=30):
+        stats = pstats.Stats(self.profiler, stream=io.StringIO())
+        functions = []
+        for (file_name, line, function), (_, calls, total, cumulative, _) in sorted(
+            stats.stats.items(), key=lambda entry: entry[1][3], reverse=True
+        )[:limit]:
+            functions.append(
+                {
+                    "function": f"{file_name}:{line}({function})",
+                    "calls": calls,
+                    "total_s": round(total, 6),
+                    "cumulative_s": round(cumulative, 6),
+                }
+            )
+        return functions
+
+    def report(self, **extra):
+        """
+        Summarize everything collected so far.
+
+        Parameters:
+        - extra: Additional JSON serializable entries of the report.
+
+        Returns:
+        dict: The histograms, the counters, the profiled functions with the
+              highest cumulative time, and `extra`.
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+        with self.lock:
+            report = {
+                "started": self.started,
+                "seconds": round(time.time() - (self.started or time.time()), 3),
+                "timers": {
+                    name: histogram.report()
+                    for name, histogram in sorted(self.histograms.items())
+                },
+                "counters": dict(sorted(self.counters.items())),
+            }
+        if self.profiler is not None:
+            report["profile"] = self.profile_report()
+            self.profiler.enable()
+        report.update(extra)
+        return report
+
+    def dump(self, path, **extra):
+        """
+        Write `report()` as JSON.
+
+        Parameters:
+        - path (str): The file to write, or "-" for standard error.
+        - extra: Additional entries of the report.
+        """
+        report = json.dumps(self.report(**extra), indent=2)
+        if path == "-":
+            print(report, file=sys.stderr)
+        else:
+            with open(path, "w") as file:
+                file.write(report + "\n")
+
+
+metrics = Metrics()
@@ -0,0 +1,200 @@
+import time
+from collections import deque
+from store import LiveSelection, StockRow, StockSelection
+
+
+class StockMutator:
+    """
+    Change the stock while keeping its cached aggregates up to date.
+
+    Parameters:
+    - stock (ColumnarStock): The store to change.
+    - aggregates (AggregateCache): The cache of the structures derived from
+                                   `stock`.
+    - log_size (int, default=100000): The number of changes kept in `log`.
+
+    Note:
+    When the cache is up to date, every change is applied to the cached
+    warehouse grouping, search index, category counts, per warehouse
+    counts, count cube and date index instead of letting the cache rebuild
+    them from the whole stock. If `ledger` is set to a `ReservationLedger`,
+    the units available to order follow the changes too.
+    """
+
+    def __init__(self, stock, aggregates, log_size=100_000):
+        self.stock = stock
+        self.aggregates = aggregates
+        self.ledger = None
+        self.log = deque(maxlen=log_size)
+
+    def add(self, record):
+        """
+        Add a stock record.
+
+        Parameters:
+        - record (dict): A dictionary with the keys `state`, `category`,
+                         `warehouse` and `date_of_stock`.
+
+        Returns:
+        int: The position of the new record in the store.
+        """
+        index = len(self.stock.columns["warehouse"])
+        self.apply(index, lambda: self.stock.append(record), unlink=False)
+        self.record("add", index, to=dict(record))
+        return index
+
+    def remove(self, index):
+        """
+        Remove a stock record.
+
+        Parameters:
+        - index (int): The position of the record in the store.
+        """
+        self.check(index)
+        previous = dict(StockRow(self.stock, index))
+        self.apply(index, lambda: self.stock.remove(index), link=False)
+        self.record("remove", index, previous=previous)
+
+    def move(self, index, warehouse):
+        """
+        Move a stock record to another warehouse.
+
+        Parameters:
+        - index (int): The position of the record in the store.
+        - warehouse (int): The new warehouse number.
+        """
+        self.change(index, "warehouse", warehouse, "move")
+
+    def change_state(self, index, state):
+        """
+        Change the state of a stock record, e.g. to "Second hand".
+
+        Parameters:
+        - index (int): The position of the record in the store.
+        - state (str): The new state.
+        """
+        self.change(index, "state", state, "state")
+
+    def change(self, index, field, value, action):
+        self.check(index)
+        previous = self.stock.value(field, index)
+        self.apply(index, lambda: self.stock.update(index, field, value))
+        self.record(action, index, previous=previous, to=value)
+
+    def check(self, index):
+        if not 0 <= index < len(self.stock.removed) or self.stock.removed[index]:
+            raise KeyError(f"no stock record at position {index}")
+
+    def apply(self, index, change, unlink=True, link=True):
+        """
+        Apply a change to one record and patch the aggregates around it.
+
+        Parameters:
+        - index (int): The position of the changed record.
+        - change (function): Changes the store.
+        - unlink (bool, default=True): The record existed before the change.
+        - link (bool, default=True): The record exists after the change.
+        """
+        in_sync = self.aggregates.version == self.stock.version
+        if unlink:
+            self.update(index, -1, in_sync)
+        change()
+        if link:
+            self.update(index, 1, in_sync)
+        if in_sync:
+            self.aggregates.advance()
+
+    def update(self, index, delta, in_sync):
+        """Add (`delta` 1) or remove (`delta` -1) a record from the aggregates."""
+        row = StockRow(self.stock, index)
+        warehouse = row["warehouse"]
+        category = row["category"]
+        item = (row["state"] + " " + category).lower()
+
+        if self.ledger is not None:
+            self.ledger.adjust(item, warehouse, delta, index)
+        if not in_sync:
+            return
+
+        values = self.aggregates.values
+        groups = values.get("stock_by_warehouse")
+        if groups is not None:
+            self.update_group(groups, warehouse, row, delta)
+        index_ = values.get("search_index")
+        if index_ is not None:
+            if item not in index_:
+                # a new name, the suggester is rebuilt on its next use
+                values.pop("suggester", None)
+            postings = index_.setdefault(item, {})
+            self.update_group(postings, warehouse, row, delta)
+            if not postings:
+                del index_[item]
+                values.pop("suggester", None)
+        counts = values.get("category_counts")
+        if counts is not None:
+            counts[category] = counts.get(category, 0) + delta
+            if not counts[category]:
+                del counts[category]
+            # the numbering follows the counts and is cheap to rebuild
+            values.pop("numeric_categories", None)
+        warehouses = values.get("warehouse_counts")
+        if warehouses is not None:
+            products = warehouses.setdefault(warehouse, {})
+            key = (row["state"], category)
+            products[key] = products.get(key, 0) + delta
+            if not products[key]:
+                del products[key]
+            if not products:
+                del warehouses[warehouse]
+        cube = values.get("count_cube")
+        if cube is not None:
+            if cube.covers(category, row["state"]):
+                cube.add(warehouse, category, row["state"], delta)
+            else:
+                # a new category or state needs a larger cube
+                values.pop("count_cube", None)
+        date_index = values.get("date_index")
+        if date_index is not None:
+            if delta > 0:
+                date_index.add(index)
+            else:
+                date_index.discard(index)
+
+    def update_group(self, groups, key, row, delta):
+        group = groups.get(key)
+        if not isinstance(group, LiveSelection):
+            if isinstance(group, StockSelection):
+                group = LiveSelection(self.stock, group.indices)
+            else:
+                group = LiveSelection(self.stock, (dct.index for dct in group or ()))
+            groups[key] = group
+
+        if delta > 0:
+            group.append(row)
+        else:
+            group.discard(row.index)
+            if not group:
+                del groups[key]
+
+    def record(self, action, index, **details):
+        self.log.append(
+            {
+                "version": self.stock.version,
+                "time": time.time(),
+                "action": action,
+                "index": index,
+                **details,
+            }
+        )
+
+    def changes_since(self, version):
+        """
+        List the logged changes made after a stock version.
+
+        Parameters:
+        - version (int): A value of `stock.version`.
+
+        Returns:
+        list: The changes, oldest first.
+        """
+        return [change for change in self.log if change["version"] > version]
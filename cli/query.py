@@ -1,8 +1,69 @@
-from data import stock, personnel
+import argparse
+import getpass
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
 from datetime import datetime as dt
-
-VALID_MENU_CHOICES = ["1", "2", "3", "4"]
+from store import ColumnarStock, StockSelection, days_in_stock
+from cache import AggregateCache
+from credentials import CredentialIndex
+from snapshot import load_snapshot
+from database import open_database
+from render import page_view, write_page
+from ledger import ReservationLedger
+from mutations import StockMutator
+from suggest import ItemSuggester
+from sharded import ShardedCounter, count_by_warehouse
+from metrics import metrics
+from journal import JournalWriter, SessionJournal
+from aging import DateIndex
+from cube import AXES, CountCube
+from allocation import POLICIES, AllocationPlanner
+from transfer import FORMATS, RecordReader
+from views import ViewStore, number_categories
+
+VALID_MENU_CHOICES = ["1", "2", "3", "4", "5"]
 YES_OR_NO = ["y", "n"]
+SNAPSHOT_ENV = "WAREHOUSE_SNAPSHOT"
+DATABASE_ENV = "WAREHOUSE_DATABASE"
+PROCESSES_ENV = "WAREHOUSE_PROCESSES"
+METRICS_ENV = "WAREHOUSE_METRICS"
+PROFILE_ENV = "WAREHOUSE_PROFILE"
+JOURNAL_ENV = "WAREHOUSE_JOURNAL"
+VIEWS_ENV = "WAREHOUSE_VIEWS"
+QUERY_COMMANDS = [
+    "list",
+    "search",
+    "suggest",
+    "browse",
+    "aging",
+    "crosstab",
+    "order",
+    "allocate",
+]
+
+# set by load_data(), which every entry point calls before the first query
+stock = None
+personnel = None
+credentials = None
+aggregates = None
+mutator = None
+ledger = None
+ledger_lock = threading.Lock()
+# set by use_processes()
+shard_counter = None
+# set by use_journal()
+journal_writer = None
+# set by use_views()
+view_store = None
+category_numbers = {}
+# the journal and the credentials of the session running in each thread
+session = threading.local()
 
 
 def get_user_name():
@@ -16,11 +77,13 @@ def greet(name):
     return f"Hello, {name}"
 
 
-def get_int(prompt):
+def get_int(prompt, minimum=None, maximum=None):
     """
     Prompt the user for an integer input and validate it.
     Parameters:
     - prompt (str): The message displayed to the user.
+    - minimum (int, optional): The smallest value accepted.
+    - maximum (int, optional): The largest value accepted.
 
     Returns:
     int: The validated integer provided by the user.
@@ -32,12 +95,30 @@ def get_int(prompt):
     while True:
         value = input(prompt)
         try:
-            return int(value)
+            number = int(value)
         except ValueError:
             print("Please enter integer.")
+            continue
+        if (minimum is not None and number < minimum) or (
+            maximum is not None and number > maximum
+        ):
+            if maximum is None:
+                print(f"Please enter an integer of at least {minimum}.")
+            else:
+                print(f"Please enter an integer from {minimum} to {maximum}.")
+            continue
+        return number
+
+
+def non_negative_int(value):
+    """Parse a command line integer that cannot be negative."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"{value} is negative")
+    return number
 
 
-def lst_of_items(name, data=None, product_counter=None, items_per_page=50):
+def lst_of_items(name, data=None, product_counter=None, items_per_page=50, pager=True):
     """
     Displays items in a paginated manner based on the warehouse.
 
@@ -50,7 +131,7 @@ def lst_of_items(name, data=None, product_counter=None, items_per_page=50):
     - name (str): Name of the user.
     - data (dict, optional): A dictionary of items
                             organized by warehouses. If not provided,
-                            it defaults to the output of the function
+                            it defaults to the cached output of the function
                             `rearrange_stock_based_on_warehouse()`.
     - product_counter (dict, optional): A dictionary to keep track of the
                                         number of products per warehouse.
@@ -58,19 +139,29 @@ def lst_of_items(name, data=None, product_counter=None, items_per_page=50):
                                         dictionary is initialized.
     - items_per_page (int, default=50): The number of items displayed
                                         per page during pagination.
+    - pager (bool, default=True): Wait for the user after each page. If False,
+                                  every page is written without prompting,
+                                  e.g. when the output goes to a pipe.
 
     Returns:
         str: Text indicating that the user has displayed a list of all items.
 
     Note:
     The items from different warehouses are displayed in separate sections.
+    Each page is written with a single call from a view of the records.
+    Without `data`, the records held by orders are left out.
     """
     if data is None:
-        data = rearrange_stock_based_on_warehouse()
+        # the records ordered are not listed, see `held_records()`
+        data = {
+            key: in_stock(value)
+            for key, value in aggregates.get("stock_by_warehouse").items()
+        }
         # prevent to change items by iterating
     if product_counter is None:
         product_counter = {}
         # prevent to change items by iterating
+    listed = 0
     for key, value in data.items():
         print()
         print(f"Items in warehouse {key}:")
@@ -80,10 +171,12 @@ def lst_of_items(name, data=None, product_counter=None, items_per_page=50):
         while page * items_per_page < len(value):
             start_idx = page * items_per_page
             end_idx = start_idx + items_per_page
-            for dct in value[start_idx:end_idx]:
-                count += 1
-                print(f"{count}. {dct['state']} {dct['category']}")
+            with metrics.timer("phase.output"):
+                write_page(page_view(value, start_idx, end_idx), count + 1)
+            count = min(end_idx, len(value))
             page += 1
+            if not pager:
+                continue
             if page * items_per_page < len(value):
                 print()
                 prompt = input(
@@ -94,20 +187,20 @@ def lst_of_items(name, data=None, product_counter=None, items_per_page=50):
                     break
             else:
                 break
-    for key, value in data.items():
-        for dct in value:
-            amount_each_warehouse = dct["warehouse"]
-            if amount_each_warehouse in product_counter:
-                product_counter[amount_each_warehouse] += 1
-            else:
-                product_counter[amount_each_warehouse] = 1
+        metrics.count("items.listed", count)
+        # every record of `value` belongs to warehouse `key`
+        listed += len(value)
+        if key in product_counter:
+            product_counter[key] += len(value)
+        else:
+            product_counter[key] = len(value)
     print()
     for number, amount_product in product_counter.items():
         print(f"Total items in warehouse {number}: {amount_product}")
     print()
     print(f"Thank you for your visit, {name}!")
 
-    return f"Listed {len(stock)} items"
+    return f"Listed {listed} items"
 
 
 def ask_for_max(name, total, item_name):
@@ -119,7 +212,10 @@ def ask_for_max(name, total, item_name):
     - item_name (str): The name of the item user is interested in.
 
     Returns:
-    bool: Returns False if the user selects 'n', and True if 'y'.
+    bool: Returns False if the user selects 'n', and True if 'y'. Also
+          returns False after 'y' when nothing could be ordered, e.g. when
+          the other sessions ordered every unit left since `total` was
+          shown.
 
     Note:
     This function is following the function 'ask_for_placing_order()'.
@@ -135,7 +231,20 @@ def ask_for_max(name, total, item_name):
             print(f"Thank you for your visit, {name}!")
             return False
         elif ask_again.lower() == "y":
-            print(f"{total} {item_name} have been ordered")
+            ordered = order_ledger().order(item_name, total, partial=True)
+            if not ordered:
+                print("Nothing has been ordered")
+                print()
+                print(f"Thank you for your visit, {name}!")
+                return False
+            record_action(
+                "order",
+                f"Ordered {ordered} {item_name}",
+                item=item_name,
+                amount=ordered,
+                employee=authenticated_user(),
+            )
+            print(f"{ordered} {item_name} have been ordered")
             print()
             print(f"Thank you for your visit, {name}")
             return True
@@ -149,25 +258,17 @@ def validate_user(func):
     - func (function): The original function being decorated.
 
     Notes:
-    - This is a decorator with three inner functions:
-        1. `authenticate()`: Validates the user's credentials against a provided list.
-        2. `prompt_username_password()`: Prompts the user for their username and password.
-        3. `wrapped_func()`: The main wrapper function which integrates the above two functions
-           and checks authentication before calling the original function.
+    - This is a decorator with two inner functions:
+        1. `prompt_username_password()`: Prompts the user for their username and password.
+        2. `wrapped_func()`: The main wrapper function which validates the credentials
+           against the `credentials` index before calling the original function.
 
     The decorator will repeatedly prompt for credentials until the user either authenticates
     successfully or chooses to exit. If authenticated, the original function (`func`) is executed.
+    The credentials are remembered for the rest of the session, in `session`, and
+    forgotten by `options()` when the session ends, so that sessions served by
+    `server.py` each authenticate on their own.
     """
-    username_password = [None, None]
-
-    def authenticate(personnel_lst, p_user_name, p_password):
-        for dct in personnel_lst:
-            if dct["user_name"] == p_user_name and dct["password"] == p_password:
-                return True
-            elif "head_of" in dct:
-                if authenticate(dct["head_of"], p_user_name, p_password):
-                    return True
-        return False
 
     def prompt_username_password():
         p_user_name = input("*** Enter the user name ***: ")
@@ -176,7 +277,7 @@ def validate_user(func):
         return p_user_name, p_password
 
     def wrapped_func(name, total, item_name):
-        nonlocal username_password
+        username_password = getattr(session, "credentials", None) or [None, None]
         authenticated = False
 
         while not authenticated:
@@ -184,23 +285,33 @@ def validate_user(func):
                 username_password = []
                 for name_password in prompt_username_password():
                     username_password.append(name_password)
-            authenticated = authenticate(
-                personnel, username_password[0], username_password[1]
-            )
+                session.credentials = username_password
+            with metrics.timer("phase.authentication"):
+                authenticated = credentials.authenticate(
+                    username_password[0], username_password[1]
+                )
 
             if authenticated:
                 result = func(name, total, item_name)
                 return result
             else:
+                metrics.count("authentication.failures")
                 print(f"Authentication failed!")
                 try_again = input("Press 'q' to exit or any other key to try again:")
                 if try_again.lower() == "q":
                     return
                 username_password = [None, None]
+                session.credentials = username_password
 
     return wrapped_func
 
 
+def authenticated_user():
+    """Return the user name the current session authenticated with, or None."""
+    username_password = getattr(session, "credentials", None)
+    return username_password[0] if username_password else None
+
+
 @validate_user
 def ask_for_placing_order(name, total, item_name):
     """
@@ -221,10 +332,13 @@ def ask_for_placing_order(name, total, item_name):
     If the user wishes to order, they're prompted for the desired quantity.
     Various messages are shown based
     on the available stock and desired quantity.
+    Ordered units are taken from `order_ledger()`, so they cannot be
+    ordered again by another session.
     """
 
     while True:
         ask_for_amount = get_int("How many would you like?: ")
+        total = min(total, order_ledger().available_amount(item_name))
 
         if ask_for_amount <= 0:
             print("Nothing has been ordered")
@@ -244,12 +358,26 @@ def ask_for_placing_order(name, total, item_name):
             return False
 
         elif total >= ask_for_amount > 0:
+            if not order_ledger().order(item_name, ask_for_amount):
+                # another session ordered the units in the meantime
+                print(
+                    f"Some of these items have just been ordered by someone else. The maximum amount that can be ordered is now {order_ledger().available_amount(item_name)}"
+                )
+                continue
+            record_action(
+                "order",
+                f"Ordered {ask_for_amount} {item_name}",
+                item=item_name,
+                amount=ask_for_amount,
+                employee=authenticated_user(),
+            )
             print(f"{ask_for_amount} {item_name} have been ordered")
             print()
             print(f"Thank you for your visit, {name}")
             return True
 
 
+@metrics.timed("phase.grouping")
 def rearrange_stock_based_on_warehouse(grouped_by_warehouse=None):
     """
     Organizes the list of dictionaries by warehouse number.
@@ -268,18 +396,217 @@ def rearrange_stock_based_on_warehouse(grouped_by_warehouse=None):
     if grouped_by_warehouse is None:
         grouped_by_warehouse = {}
 
-    for dict in stock:
-        key = dict["warehouse"]
-
+    for key, selection in stock.group_by("warehouse").items():
         if key not in grouped_by_warehouse:
-            grouped_by_warehouse[key] = []
-
-        grouped_by_warehouse[key].append(dict)
+            grouped_by_warehouse[key] = selection
+        else:
+            grouped_by_warehouse[key].extend(selection)
 
     return grouped_by_warehouse
 
 
-def searching_for_item(name, data=None, continue_loop=True):
+def group_by_item(selection):
+    """
+    Group the records of a `StockSelection` by their normalized item name.
+
+    Parameters:
+    - selection (StockSelection): The records of one warehouse.
+
+    Returns:
+    dict: A dictionary mapping each lowercased "state category" name to the
+          array of positions of its records, in selection order, or None when
+          names differing only in case would have to be merged.
+
+    Note:
+    The records are grouped by their integer codes, so no record is decoded.
+    """
+    store = selection.store
+    states = store.columns["state"]
+    categories = store.columns["category"]
+    groups = {}
+    for position in selection.indices:
+        key = (states[position], categories[position])
+        positions = groups.get(key)
+        if positions is None:
+            positions = groups[key] = array("q")
+        positions.append(position)
+
+    names = {
+        key: (
+            store.dictionaries["state"][key[0]]
+            + " "
+            + store.dictionaries["category"][key[1]]
+        ).lower()
+        for key in groups
+    }
+    if len(set(names.values())) < len(names):
+        return None
+    return {names[key]: positions for key, positions in groups.items()}
+
+
+@metrics.timed("phase.grouping")
+def build_search_index(data=None):
+    """
+    Build an inverted index from the normalized item name to its records.
+
+    Parameters:
+    - data (dict, optional): A dictionary of items
+                            organized by warehouses. If not provided,
+                            it defaults to the output of the function
+                            `rearrange_stock_based_on_warehouse()`.
+
+    Returns:
+    dict: A dictionary where keys are lowercased "state category" names and
+          values are dictionaries mapping each warehouse number to the list
+          of matching records, in stock order.
+
+    Note:
+    The index is built once so that a search only looks up its postings
+    instead of comparing the name of every record in every warehouse.
+    """
+    if data is None:
+        data = rearrange_stock_based_on_warehouse()
+
+    index = {}
+    for warehouse_number, product in data.items():
+        groups = None
+        if isinstance(product, StockSelection):
+            groups = group_by_item(product)
+        if groups is not None:
+            for key, positions in groups.items():
+                postings = index.setdefault(key, {})
+                postings[warehouse_number] = StockSelection(product.store, positions)
+            continue
+        for dct in product:
+            key = dct["state"].lower() + " " + dct["category"].lower()
+            postings = index.setdefault(key, {})
+            if warehouse_number not in postings:
+                # an empty list or selection of the same kind as `product`
+                postings[warehouse_number] = product[0:0]
+            postings[warehouse_number].append(dct)
+
+    return index
+
+
+@metrics.timed("phase.scanning")
+def search_results(item, data=None, index=None, reference=None):
+    """
+    Look up the availability of an item in each warehouse.
+
+    Parameters:
+    - item (str): The "state category" name of the item, in any case.
+    - data (dict, optional): A dictionary of items
+                            organized by warehouses. If not provided,
+                            it defaults to the cached output of the function
+                            `rearrange_stock_based_on_warehouse()`.
+    - index (dict, optional): An inverted index as returned by
+                            `build_search_index()`. If not provided, the
+                            cached index is used, or a new one is built
+                            from `data` when `data` is given.
+    - reference (datetime, optional): The moment the stock ages are measured at.
+                                      If not provided, `datetime.today()` is used.
+
+    Returns:
+    dict: The searched item, the total amount available and, for every
+          warehouse, its amount and the days in stock of each record.
+          When nothing is found, `suggestions` lists close item names.
+
+    Note:
+    Without `data`, the records held by orders are left out, so the amounts
+    match what can still be ordered from `order_ledger()`.
+    """
+    held = False
+    if data is None:
+        data = aggregates.get("stock_by_warehouse")
+        if index is None:
+            index = aggregates.get("search_index")
+        held = True
+    if index is None:
+        index = build_search_index(data)
+    if reference is None:
+        reference = dt.today()
+
+    postings = index.get(item.lower(), {})
+    warehouses = []
+    total = 0
+    with metrics.timer("phase.date_parsing"):
+        for warehouse_number in data:
+            records = postings.get(warehouse_number, ())
+            if held and records:
+                # the units ordered so far are not available anymore
+                records = in_stock(records)
+            ages = days_in_stock(records, reference)
+            warehouses.append(
+                {
+                    "warehouse": warehouse_number,
+                    "amount": len(ages),
+                    "days_in_stock": ages,
+                }
+            )
+            total += len(ages)
+
+    result = {
+        "command": "search",
+        "item": item,
+        "total": total,
+        "warehouses": warehouses,
+    }
+    if not postings:
+        metrics.count("search.misses")
+        result["suggestions"] = item_suggestions(item, index)
+    return result
+
+
+def item_suggestions(item, index=None, limit=5):
+    """
+    Suggest item names for a partial or misspelled search.
+
+    Parameters:
+    - item (str): The name as typed by the user.
+    - index (dict, optional): An inverted index as returned by
+                            `build_search_index()`. If not provided, the
+                            cached suggester of the cached index is used.
+    - limit (int, default=5): The maximum number of suggestions.
+
+    Returns:
+    list: Lowercased item names, completions of `item` first.
+    """
+    if index is None:
+        suggester = aggregates.get("suggester")
+    else:
+        suggester = ItemSuggester(index)
+    return suggester.suggest(item, limit)
+
+
+def choose_suggestion(item, index=None):
+    """
+    Let the user pick a suggested name when an item is not found.
+
+    Parameters:
+    - item (str): The name as typed by the user.
+    - index (dict, optional): The index searched, see `item_suggestions()`.
+
+    Returns:
+    str: The chosen suggestion, or `item` if it exists, if there is nothing
+         to suggest or if the user keeps their search.
+    """
+    if item.lower() in (aggregates.get("search_index") if index is None else index):
+        return item
+
+    suggestions = item_suggestions(item, index)
+    if not suggestions:
+        return item
+
+    print(f"No item is named {item}. Did you mean:")
+    for number, suggestion in enumerate(suggestions, start=1):
+        print(f"{number}. {suggestion.capitalize()}")
+    choice = input("Type the number of the item, or press enter to keep your search: ")
+    if choice.isdigit() and 1 <= int(choice) <= len(suggestions):
+        return suggestions[int(choice) - 1]
+    return item
+
+
+def searching_for_item(name, data=None, continue_loop=True, index=None):
     """
     Search item and validate the amount of the item in each any number of warehouse.
 
@@ -287,8 +614,12 @@ def searching_for_item(name, data=None, continue_loop=True):
     - name (str): The name of the user.
     - data (dict, optional): A dictionary of items
                             organized by warehouses. If not provided,
-                            it defaults to the output of the function
+                            it defaults to the cached output of the function
                             `rearrange_stock_based_on_warehouse()`.
+    - index (dict, optional): An inverted index as returned by
+                            `build_search_index()`. If not provided, the
+                            cached index is used, or a new one is built
+                            from `data` when `data` is given.
     Returns:
         str: The item the user has searched.
 
@@ -298,31 +629,23 @@ def searching_for_item(name, data=None, continue_loop=True):
     This function compares the amount of the searched item in each warehouse .
     If there is no searched item it will quit the process.
     """
-    if data is None:
-        data = rearrange_stock_based_on_warehouse()
-
     total_amount = 0
     while True:
         looking_for_item = input("What is the name of the item?: ")
+        looking_for_item = choose_suggestion(looking_for_item, index)
+        result = search_results(looking_for_item, data, index)
 
-        for warehouse_number, product in data.items():
-            count = 0
-            for dct in product:
-                if (
-                    looking_for_item.lower()
-                    == dct["state"].lower() + " " + dct["category"].lower()
-                ):
-                    date = (
-                        dt.today()
-                        - dt.strptime(dct["date_of_stock"], "%Y-%m-%d %H:%M:%S")
-                    ).days
-
+        with metrics.timer("phase.output"):
+            for warehouse in result["warehouses"]:
+                warehouse_number = warehouse["warehouse"]
+                for date in warehouse["days_in_stock"]:
                     print(
                         f"- {looking_for_item.capitalize()} (in stock for {date} days) in Warehouse {warehouse_number}"
                     )
-                    count += 1
-                    total_amount += 1
-            print(f"Maximum availability: {count} in Warehouse {warehouse_number}")
+                print(
+                    f"Maximum availability: {warehouse['amount']} in Warehouse {warehouse_number}"
+                )
+        total_amount += result["total"]
 
         print(f"Total available amount is: {total_amount}")
 
@@ -358,6 +681,7 @@ def searching_for_item(name, data=None, continue_loop=True):
                         return f"Searched a {looking_for_item.capitalize()}"
 
 
+@metrics.timed("phase.grouping")
 def product_amount_counter(product_amount=None):
     """
     Count the total amount for each product category from the `stock` list.
@@ -372,23 +696,22 @@ def product_amount_counter(product_amount=None):
     dict: A dictionary with product categories as keys and their respective counts as values.
 
     Notes:
-    This function processes the `stock` list of dictionary to derive the counts for each product category.
+    This function sums the cached count cube for each product category.
     """
 
     if product_amount is None:
         product_amount = {}
 
-    for dct in stock:
-        key = dct["category"]
+    for key, amount in aggregates.get("count_cube").category_totals().items():
         if key in product_amount:
-            product_amount[key] += 1
+            product_amount[key] += amount
         else:
-            product_amount[key] = 1
+            product_amount[key] = amount
 
     return product_amount
 
 
-def numeric_product_amount(counter=1, data=None, product_dct=None):
+def numeric_product_amount(counter=1, data=None, product_dct=None, numbers=None):
     """
     Map each product category to a numeric value and its respective amount.
 
@@ -396,9 +719,13 @@ def numeric_product_amount(counter=1, data=None, product_dct=None):
     - counter (int, default=1): The starting number for numeric mapping.
     - data (dict, optional): The dictionary containing product categories and
                              their respective counts. If not provided, it defaults
-                             to the output of `product_amount_counter()`.
+                             to the cached output of `product_amount_counter()`.
     - product_dct (dict, optional): A starting dictionary for numeric mapping.
                                     If not provided, an empty dictionary is initialized.
+    - numbers (dict, optional): The number each category was given before.
+                                If provided, categories keep these numbers
+                                and new ones are numbered after the highest,
+                                see `views.number_categories()`.
 
     Returns:
     dict: A dictionary where keys are numeric values and values are lists containing
@@ -408,7 +735,9 @@ def numeric_product_amount(counter=1, data=None, product_dct=None):
     This function assigns a numeric value to each product category for easier reference.
     """
     if data is None:
-        data = product_amount_counter()
+        data = aggregates.get("category_counts")
+    if product_dct is None and numbers is not None:
+        return number_categories(data, numbers)
     if product_dct is None:
         product_dct = {}
 
@@ -419,6 +748,51 @@ def numeric_product_amount(counter=1, data=None, product_dct=None):
     return product_dct
 
 
+@metrics.timed("phase.scanning")
+def category_by_warehouse(category, data=None):
+    """
+    Count the products of a category in each warehouse.
+
+    Parameters:
+    - category (str): The product category. Every category containing this
+                      text is counted.
+    - data (dict, optional): A dictionary of items
+                            organized by warehouses. If not provided,
+                            the cached counts of each warehouse are used
+                            instead of scanning the items.
+
+    Returns:
+    dict: A dictionary mapping each warehouse number to a dictionary of
+          "state category" names and their amounts.
+    """
+    if data is None:
+        # the records ordered are not counted, see `held_records()`
+        held = held_counts("warehouse", "state", "category")
+        warehouses = {}
+        for warehouse_number, products in aggregates.get("warehouse_counts").items():
+            state_category = {}
+            for (state, product_category), amount in products.items():
+                amount -= held[(warehouse_number, state, product_category)]
+                if category in product_category and amount:
+                    state_category[state + " " + product_category] = amount
+            warehouses[warehouse_number] = state_category
+        return warehouses
+
+    warehouses = {}
+    for warehouse_number, product in data.items():
+        state_category = {}
+        for dct in product:
+            if category in dct["category"]:
+                key = dct["state"] + " " + dct["category"]
+                if key in state_category:
+                    state_category[key] += 1
+                else:
+                    state_category[key] = 1
+        warehouses[warehouse_number] = state_category
+
+    return warehouses
+
+
 def browse_by_category(
     name, counter=1, product_counter=None, product_dct=None, data=None, total_amount=0
 ):
@@ -429,15 +803,16 @@ def browse_by_category(
 
     Parameters:
     - name (str): The name of the user.
-    - counter (int, default = 1): a numeric code for the categories
-    - product_counter (dict): A dictionary mapping product names
-                            to their stock counts.
+    - counter (int, default = 1): Not used, the categories are shown with
+                                  their number in `product_dct`.
+    - product_counter (dict): Not used, the counts are read from `product_dct`.
     - product_dct (dict): A dictionary with numeric keys mapping to product
-                            names and their respective amounts
+                            names and their respective amounts. If not
+                            provided, the cached `numeric_categories` are used.
     - data (dict, optional): A dictionary of items
                             organized by warehouses. If not provided,
-                            it defaults to the output of the function
-                            `rearrange_stock_based_on_warehouse()`.
+                            the cached counts of each warehouse are used,
+                            see `category_by_warehouse()`.
     - total_amount (int, default = 0):  Total number of products
                                         within each category.
 
@@ -449,39 +824,37 @@ def browse_by_category(
     This function is executed if the user selects number 3 in option().
 
     """
-    # if product_counter is None:
-    product_counter = product_amount_counter()
     if product_dct is None:
-        product_dct = numeric_product_amount()
-    if data is None:
-        data = rearrange_stock_based_on_warehouse()
+        held = held_counts("category")
+        product_dct = {
+            number: [key, value - held[(key,)]]
+            for number, (key, value) in aggregates.get("numeric_categories").items()
+        }
 
-    for key, value in product_counter.items():
-        print(f"{counter}. {key} ({value})")
-        counter += 1
+    # the numbers are kept from one run to the next, see `use_views()`
+    for number, (key, value) in product_dct.items():
+        print(f"{number}. {key} ({value})")
 
-    prompt = get_int("Type the number of the category to browse: ")
+    while True:
+        prompt = get_int("Type the number of the category to browse: ")
+        # numbers of categories out of stock are not in the menu
+        if prompt in product_dct:
+            break
+        print(f"{prompt} is not a category number. please try again.")
     print()
 
     for key, value in product_dct.items():
         if prompt == key:
             selected_category = value[0]
-            for warehouse_number, product in data.items():
-                total = 0
-                state_category = {}
-                for dct in product:
-                    key = dct["state"] + " " + dct["category"]
-                    if value[0] in dct["category"]:
-                        if key in state_category:
-                            state_category[key] += 1
-                        else:
-                            state_category[key] = 1
-                        total += 1
-                        total_amount += 1
-                for product_name, amount in state_category.items():
-                    print(
-                        f"{product_name}, in amount ({amount}) in warehouse {warehouse_number}"
-                    )
+            warehouses = category_by_warehouse(value[0], data)
+            for warehouse_number, state_category in warehouses.items():
+                total = sum(state_category.values())
+                total_amount += total
+                with metrics.timer("phase.output"):
+                    for product_name, amount in state_category.items():
+                        print(
+                            f"{product_name}, in amount ({amount}) in warehouse {warehouse_number}"
+                        )
                 print(
                     f"- Total of ({total}) {value[0]} in warehouse {warehouse_number}"
                 )
@@ -491,16 +864,78 @@ def browse_by_category(
     return f"Browsed the category {selected_category}."
 
 
-def options(name, actions_taken=[]):
+def stock_aging_report(name, limit=100):
     """
-    Prompt the user to continuously select one of three options:
+    Display the oldest items, or the items older than a number of days.
+
+    Parameters:
+    - name (str): The name of the user.
+    - limit (int, default=100): The most items displayed by the
+                                "older than" report.
+
+    Returns:
+        str: The report the user has displayed.
+
+    Note:
+    This function is executed if the user selects number 4 in option().
+    The items are read from the cached date index, see `aging_results()`.
+    """
+    print("1. Items older than a number of days\n2. Oldest items")
+    report = get_int("Type the number of the report: ", 1, 2)
+    while True:
+        warehouse = input("Type the warehouse number, or press enter for all: ")
+        if not warehouse or warehouse.isdigit():
+            break
+        print(f"{warehouse} is not a valid warehouse number. please try again.")
+    category = input("Type the category name or number, or press enter for all: ")
+    warehouse = int(warehouse) if warehouse else None
+
+    if report == 1:
+        days = get_int("Type the number of days in stock: ", 0)
+        result = aging_results(
+            older_than=days, warehouse=warehouse, category=category or None, limit=limit
+        )
+    else:
+        amount = get_int("Type the number of items: ", 0)
+        result = aging_results(
+            oldest=amount, warehouse=warehouse, category=category or None
+        )
+
+    if "error" in result:
+        print(f"{result['error']}: {result['category']}")
+        print(f"Thank you for your visit, {name}!")
+        return f"Requested an aging report of the unknown category {category}"
+
+    with metrics.timer("phase.output"):
+        for item in result["items"]:
+            print(
+                f"- {item['item']} (in stock for {item['days_in_stock']} days) in Warehouse {item['warehouse']}"
+            )
+    if len(result["items"]) < result["total"]:
+        print(f"... and {result['total'] - len(result['items'])} more")
+    print(f"- Total of ({result['total']}) items")
+    print(f"Thank you for your visit, {name}!")
+    if report == 1:
+        return f"Listed {result['total']} items older than {days} days"
+    return f"Listed the {result['total']} oldest items"
+
+
+def options(name, journal=None, pager=True):
+    """
+    Prompt the user to continuously select one of five options:
     1. List items by warehouse
     2. Search an item and place an order
-    3. Quit
+    3. Browse by category
+    4. Stock aging report
+    5. Quit
 
     Parameters:
     - name (str): The name of the user.
-    - actions_taken (lst): Log actions taken during the session.
+    - journal (SessionJournal, optional): Records the actions taken during
+                                          the session. If not provided, a
+                                          new journal is started for `name`,
+                                          logged to `journal_writer` if set.
+    - pager (bool, default=True): Page the list of items, see `lst_of_items()`.
 
     Returns:
     None. This function only interacts with the
@@ -512,52 +947,925 @@ def options(name, actions_taken=[]):
     The function runs in a loop until
     the user decides to quit.
     """
-    while True:
-        query_for_options = input(
-            "What would you like to do?\n1. List items by warehouse\n2. Search an item and place an order\n3. Browse by category\n4. Quit\nType the number of the operation(1\\2\\3\\4): "
-        )
+    if journal is None:
+        journal = SessionJournal(name, journal_writer)
+    session.journal = journal
+    session.credentials = None
+
+    try:
+        while True:
+            query_for_options = input(
+                "What would you like to do?\n1. List items by warehouse\n2. Search an item and place an order\n3. Browse by category\n4. Stock aging report\n5. Quit\nType the number of the operation(1\\2\\3\\4\\5): "
+            )
 
-        if query_for_options == "4":
-            print(f"Thank you for your visit, {name}!")
-            break
+            if query_for_options == "5":
+                print(f"Thank you for your visit, {name}!")
+                break
 
-        if query_for_options not in VALID_MENU_CHOICES:
-            print("**************************************************")
-            print(f"{query_for_options} is not valid operation")
-            print("**************************************************")
-            print()
-            print(f"Thank you for your visit, {name}!")
+            if query_for_options not in VALID_MENU_CHOICES:
+                print("**************************************************")
+                print(f"{query_for_options} is not valid operation")
+                print("**************************************************")
+                print()
+                print(f"Thank you for your visit, {name}!")
+
+            started = time.perf_counter()
+            if query_for_options == "1":
+                with metrics.timer("operation.list"):
+                    action = lst_of_items(name, pager=pager)
+                journal.record("list", action, started)
+            elif query_for_options == "2":
+                with metrics.timer("operation.search"):
+                    action = searching_for_item(name)
+                journal.record("search", action, started)
+            elif query_for_options == "3":
+                with metrics.timer("operation.browse"):
+                    action = browse_by_category(name, product_counter={})
+                journal.record("browse", action, started)
+            elif query_for_options == "4":
+                with metrics.timer("operation.aging"):
+                    action = stock_aging_report(name)
+                journal.record("aging", action, started)
+    finally:
+        # the next session of this thread must authenticate again
+        session.journal = None
+        session.credentials = None
 
-        if query_for_options == "1":
-            action = lst_of_items(name)
-            actions_taken.append(action)
-        elif query_for_options == "2":
-            action = searching_for_item(name)
-            actions_taken.append(action)
-        elif query_for_options == "3":
-            action = browse_by_category(name, product_counter={})
-            actions_taken.append(action)
     print("In this session you have:")
-    for idx, done in enumerate(actions_taken, start=1):
-        print(f"{idx}. {done}")
+    # orders are also summed up by the search they were placed from
+    for idx, done in journal.numbered(exclude=("order",)):
+        print(f"{idx}. {done['action']}")
 
 
-def main():
+def record_action(operation, action, started=None, **details):
+    """
+    Record an action in the journal of the session of the calling thread.
+
+    Parameters:
+    - operation (str): The kind of action, e.g. "order".
+    - action (str): The description of the action.
+    - started (float, optional): The `time.perf_counter()` value when the
+                                 action started.
+    - details: Additional fields of the journal entry.
+
+    Returns:
+    None. Nothing is recorded outside of a session.
+    """
+    journal = getattr(session, "journal", None)
+    if journal is not None:
+        journal.record(operation, action, started, **details)
+
+
+def use_journal(path=None):
+    """
+    Choose where the actions of every session are logged.
+
+    Parameters:
+    - path (str, optional): The journal file entries are appended to. If not
+                            provided, actions are only kept in memory.
+
+    Returns:
+    None. The module level `journal_writer` is replaced.
+    """
+    global journal_writer
+
+    if journal_writer is not None:
+        journal_writer.close()
+    journal_writer = None
+    if path is not None:
+        journal_writer = JournalWriter(path)
+
+
+def order_ledger():
+    """
+    Return the reservation ledger every order is taken from.
+
+    Returns:
+    ReservationLedger: The ledger, built from the search index on first use.
+    """
+    global ledger
+
+    with ledger_lock:
+        if ledger is None:
+            cache = aggregates
+            ledger = ReservationLedger.from_index(
+                cache.get("search_index"),
+                # the records of an item are read from the current index
+                postings=lambda item, warehouse: cache.get("search_index")
+                .get(item, {})
+                .get(warehouse, ()),
+            )
+            mutator.ledger = ledger
+    return ledger
+
+
+def held_records():
+    """
+    Return the records reserved or ordered through `order_ledger()`.
+
+    Returns:
+    dict: The positions of the held records, as keys. It is empty until the
+          first order, and belongs to the ledger: it must not be changed.
+    """
+    return {} if ledger is None else ledger.held
+
+
+def in_stock(records):
+    """
+    Leave the records held by orders out of a selection.
+
+    Parameters:
+    - records (StockSelection or DatabaseSelection): The records.
+
+    Returns:
+    StockSelection or DatabaseSelection: The records that can still be
+                                         ordered, `records` itself when
+                                         nothing is held.
+    """
+    held = held_records()
+    return records.without(held) if held else records
+
+
+def held_rows():
+    """
+    Return the records held by orders that are still in the stock.
+
+    Returns:
+    list: The records, as `StockRow`s or dictionaries.
+    """
+    return [
+        stock[index] for index, key in list(held_records().items()) if key is not None
+    ]
+
+
+def held_counts(*fields):
+    """
+    Count the records held by orders for each combination of field values.
+
+    Parameters:
+    - fields (str): "warehouse", "category" or "state".
+
+    Returns:
+    Counter: The number of held records of each tuple of values.
+    """
+    return Counter(tuple(row[field] for field in fields) for row in held_rows())
+
+
+def use_views(path=None):
+    """
+    Choose where the materialized views are kept between runs.
+
+    Parameters:
+    - path (str, optional): The file of the views, see `views.py`. The
+                            warehouse grouping and the category counts are
+                            loaded from it when the stock has not changed,
+                            and rebuilt in the background otherwise. If not
+                            provided, they are built when first needed and
+                            the categories are numbered in stock order.
+
+    Returns:
+    None. The module level `view_store` and `category_numbers` are replaced.
+    """
+    global view_store, category_numbers
+
+    if view_store is not None:
+        view_store.wait()
+    view_store = ViewStore(path) if path else None
+    category_numbers = {} if view_store is None else view_store.numbers
+    if aggregates is not None:
+        aggregates.values.pop("numeric_categories", None)
+        if view_store is not None:
+            view_store.attach(stock, aggregates)
+
+
+def use_processes(processes=None):
+    """
+    Choose how the per warehouse counts are computed.
+
+    Parameters:
+    - processes (int, optional): The number of worker processes the stock is
+                                 sharded over. If not provided, or below 2,
+                                 the counts are computed in this process.
+
+    Returns:
+    None. The module level `shard_counter` is replaced.
+    """
+    global shard_counter
+
+    if shard_counter is not None:
+        shard_counter.close()
+    shard_counter = None
+    if processes is not None and processes > 1:
+        shard_counter = ShardedCounter(processes)
+    if aggregates is not None:
+        aggregates.values.pop("warehouse_counts", None)
+
+
+def load_data(snapshot=None, database=None):
+    """
+    Load the stock and personnel data used by every operation.
+
+    Parameters:
+    - snapshot (str, optional): A snapshot file written by `snapshot.py`.
+    - database (str, optional): Otherwise, an SQLite database written by
+                                `database.py`. The records stay on disk.
+                                If neither is provided, the data is
+                                imported from `data.py`.
+
+    Returns:
+    None. See `set_data()`.
+
+    Note:
+    Derived structures such as the search index are built by `aggregates`
+    the first time they are needed, so loading a snapshot does not depend
+    on the number of records.
+    """
+    if snapshot is not None:
+        set_data(*load_snapshot(snapshot))
+    elif database is not None:
+        set_data(*open_database(database))
+    else:
+        from data import stock as stock_records, personnel as personnel_records
+
+        set_data(ColumnarStock.from_records(stock_records), personnel_records)
+
+
+def set_data(new_stock, new_personnel):
+    """
+    Use the given stock and personnel data for every operation.
+
+    Parameters:
+    - new_stock (ColumnarStock or DatabaseStock): The stock store.
+    - new_personnel (list): The nested personnel list.
+
+    Returns:
+    None. The module level `stock`, `personnel`, `credentials`,
+    `aggregates` and `mutator` are replaced, and `ledger` is reset.
+
+    Note:
+    Changes to the stock should go through `mutator`, which keeps the
+    cached aggregates and the order ledger up to date. A `DatabaseStock`
+    is read-only.
+    """
+    global stock, personnel, credentials, aggregates, mutator, ledger
+
+    stock = new_stock
+    personnel = new_personnel
+    credentials = CredentialIndex(personnel)
+
+    aggregates = AggregateCache(stock)
+    aggregates.register("stock_by_warehouse", rearrange_stock_based_on_warehouse)
+    aggregates.register("category_counts", product_amount_counter)
+    aggregates.register(
+        "numeric_categories", lambda: numeric_product_amount(numbers=category_numbers)
+    )
+    aggregates.register(
+        "search_index",
+        lambda: build_search_index(aggregates.get("stock_by_warehouse")),
+    )
+    aggregates.register(
+        "suggester", lambda: ItemSuggester(aggregates.get("search_index"))
+    )
+    aggregates.register(
+        "date_index", metrics.timed("phase.grouping")(lambda: DateIndex(stock))
+    )
+    aggregates.register(
+        "count_cube",
+        lambda: CountCube.from_counts(
+            aggregates.get("warehouse_counts"),
+            stock.dictionaries["category"],
+            stock.dictionaries["state"],
+        ),
+    )
+    aggregates.register(
+        "warehouse_counts",
+        metrics.timed("phase.grouping")(
+            lambda: count_by_warehouse(stock, shard_counter)
+        ),
+    )
+    # a storage backend may compute some aggregates itself, e.g. with SQL
+    if hasattr(stock, "aggregate_builders"):
+        for name, builder in stock.aggregate_builders().items():
+            aggregates.register(name, metrics.timed("phase.grouping")(builder))
+    mutator = StockMutator(stock, aggregates)
+    ledger = None
+    if view_store is not None:
+        view_store.attach(stock, aggregates)
+
+
+def list_results(warehouse=None, data=None):
+    """
+    Yield every item of every warehouse, followed by the warehouse total.
+
+    Parameters:
+    - warehouse (int, optional): Only list this warehouse. If not provided,
+                                 every warehouse is listed.
+    - data (dict, optional): A dictionary of items
+                            organized by warehouses. If not provided,
+                            it defaults to the cached output of the function
+                            `rearrange_stock_based_on_warehouse()`.
+
+    Yields:
+    dict: One result per item, numbered per warehouse as in `lst_of_items()`,
+          and one result with the total of each warehouse.
+    """
+    if data is None:
+        data = aggregates.get("stock_by_warehouse")
+        held = True
+    else:
+        held = False
+
+    for warehouse_number, product in data.items():
+        if warehouse is not None and warehouse != warehouse_number:
+            continue
+        if held:
+            product = in_stock(product)
+        count = 0
+        for dct in product:
+            count += 1
+            yield {
+                "command": "list",
+                "warehouse": warehouse_number,
+                "number": count,
+                "item": f"{dct['state']} {dct['category']}",
+            }
+        yield {"command": "list", "warehouse": warehouse_number, "total": count}
+
+
+def resolve_category(category):
+    """
+    Turn a category number of the `numeric_product_amount()` menu into its name.
+
+    Parameters:
+    - category (str): The category name, or its number.
+
+    Returns:
+    str: The category name, or `category` itself if it is not a known number.
+    """
+    if category.isdigit():
+        numbered = aggregates.get("numeric_categories").get(int(category))
+        if numbered is not None:
+            return numbered[0]
+    return category
+
+
+def browse_results(category):
+    """
+    Count the products of a category in each warehouse.
+
+    Parameters:
+    - category (str): The category name, or its number in the
+                      `numeric_product_amount()` menu.
+
+    Returns:
+    dict: The category, the total amount and, for every warehouse, its
+          amount of each "state category" product.
+    """
+    category = resolve_category(category)
+    if category not in aggregates.get("category_counts"):
+        return {"command": "browse", "category": category, "error": "Unknown category"}
+
+    warehouses = []
+    total_amount = 0
+    for warehouse_number, state_category in category_by_warehouse(category).items():
+        total = sum(state_category.values())
+        warehouses.append(
+            {"warehouse": warehouse_number, "total": total, "products": state_category}
+        )
+        total_amount += total
+
+    return {
+        "command": "browse",
+        "category": category,
+        "total": total_amount,
+        "warehouses": warehouses,
+    }
+
+
+@metrics.timed("phase.scanning")
+def aging_results(
+    older_than=None,
+    oldest=None,
+    warehouse=None,
+    category=None,
+    limit=100,
+    reference=None,
+):
+    """
+    List the items in stock for the longest time from the cached date index.
+
+    Parameters:
+    - older_than (int, optional): Select the items in stock for more than
+                                  this many days.
+    - oldest (int, optional): Otherwise, select this many of the oldest items.
+    - warehouse (int, optional): Only select this warehouse.
+    - category (str, optional): Only select this category, by name or by
+                                number.
+    - limit (int, default=100): The most items listed by `older_than`.
+    - reference (datetime, optional): The moment the stock ages are measured at.
+                                      If not provided, `datetime.today()` is used.
+
+    Returns:
+    dict: The query, the total number of matching items and the items,
+          oldest first, with their warehouse, date and days in stock. The
+          records held by orders are not counted.
+    """
+    result = {"command": "aging", "warehouse": warehouse, "category": category}
+    if category is not None:
+        category = result["category"] = resolve_category(category)
+        if category not in aggregates.get("category_counts"):
+            result["error"] = "Unknown category"
+            return result
+    if reference is None:
+        reference = dt.today()
+
+    date_index = aggregates.get("date_index")
+    # the records held by orders are left out, so a few more are read
+    held = held_records()
+    if older_than is not None:
+        result["older_than"] = older_than
+        result["total"] = date_index.count_older_than(
+            older_than, reference, warehouse, category
+        )
+        records = date_index.older_than(
+            older_than,
+            reference,
+            warehouse,
+            category,
+            None if limit is None else limit + len(held),
+        )
+        if held:
+            rows = [
+                row
+                for row in held_rows()
+                if warehouse in (None, row["warehouse"])
+                and category in (None, row["category"])
+            ]
+            result["total"] -= sum(
+                age > older_than for age in days_in_stock(rows, reference)
+            )
+            records = records.without(held)[:limit]
+    else:
+        result["oldest"] = oldest
+        records = date_index.oldest(oldest + len(held), warehouse, category)
+        if held:
+            records = records.without(held)[:oldest]
+        result["total"] = len(records)
+
+    result["items"] = [
+        {
+            "warehouse": dct["warehouse"],
+            "item": f"{dct['state']} {dct['category']}",
+            "date_of_stock": dct["date_of_stock"],
+            "days_in_stock": age,
+        }
+        for dct, age in zip(records, days_in_stock(records, reference))
+    ]
+    return result
+
+
+def crosstab_results(rows, columns, warehouse=None, category=None, state=None):
+    """
+    Count the items for each pair of values of two fields, from the count cube.
+
+    Parameters:
+    - rows (str): "warehouse", "category" or "state".
+    - columns (str): Another one of these fields.
+    - warehouse (int, optional): Only count this warehouse.
+    - category (str, optional): Only count this category, by name or number.
+    - state (str, optional): Only count this state.
+
+    Returns:
+    dict: The query, the table of counts, the total of each row and
+          column, and the grand total.
+    """
+    if category is not None:
+        category = resolve_category(category)
+    result = {
+        "command": "crosstab",
+        "rows": rows,
+        "columns": columns,
+        "warehouse": warehouse,
+        "category": category,
+        "state": state,
+    }
+    try:
+        table = aggregates.get("count_cube").crosstab(
+            rows, columns, warehouse, category, state
+        )
+    except ValueError as error:
+        result["error"] = str(error)
+        return result
+
+    # the records ordered are not counted, see `held_records()`
+    filters = {"warehouse": warehouse, "category": category, "state": state}
+    for values, amount in held_counts(*AXES).items():
+        labels = dict(zip(AXES, values))
+        if any(filters[axis] not in (None, labels[axis]) for axis in AXES):
+            continue
+        cells = table[labels[rows]]
+        cells[labels[columns]] -= amount
+        if not cells[labels[columns]]:
+            del cells[labels[columns]]
+            if not cells:
+                del table[labels[rows]]
+
+    column_totals = {}
+    for cells in table.values():
+        for column, amount in cells.items():
+            column_totals[column] = column_totals.get(column, 0) + amount
+    result["table"] = table
+    result["row_totals"] = {row: sum(cells.values()) for row, cells in table.items()}
+    result["column_totals"] = column_totals
+    result["total"] = sum(result["row_totals"].values())
+    return result
+
+
+def order_results(item, amount, user_name, password, order_max=False):
+    """
+    Place an order for an item without prompting.
+
+    Parameters:
+    - item (str): The "state category" name of the item, in any case.
+    - amount (int): The quantity to order.
+    - user_name (str): The user name of the employee placing the order.
+    - password (str): The password of the employee.
+    - order_max (bool, default=False): Order the maximum available when
+                                       `amount` is more than what is in stock.
+
+    Returns:
+    dict: The item, the amount requested, available and ordered, and an
+          `error` message when nothing could be ordered.
+    """
+    result = {"command": "order", "item": item, "requested": amount, "ordered": 0}
+    with metrics.timer("phase.authentication"):
+        authenticated = credentials.authenticate(user_name, password)
+    if not authenticated:
+        metrics.count("authentication.failures")
+        result["error"] = "Authentication failed"
+        return result
+
+    result["available"] = order_ledger().available_amount(item)
+    if amount <= 0:
+        result["error"] = "Nothing has been ordered"
+        return result
+
+    result["ordered"] = order_ledger().order(item, amount, partial=order_max)
+    if not result["ordered"]:
+        result["error"] = "There are not this many available"
+    else:
+        record_action(
+            "order",
+            f"Ordered {result['ordered']} {item}",
+            item=item,
+            amount=result["ordered"],
+            employee=user_name,
+        )
+    return result
+
+
+def allocation_results(path, policy="fifo", partial=True, format=None):
+    """
+    Plan the shipment of a file of order lines from specific stock records.
+
+    Parameters:
+    - path (str): A CSV or JSON Lines file of order lines, with the fields
+                  `order`, `item`, `amount` and optionally `warehouse`, or
+                  "-" for the standard input.
+    - policy (str, default="fifo"): The allocation policy, one of `POLICIES`.
+    - partial (bool, default=True): Allocate part of a line that cannot be
+                                    filled.
+    - format (str, optional): "csv" or "jsonl". If not provided, it is told
+                              by the extension of `path`.
+
+    Yields:
+    dict: One result per order line, with its shipments, then the summary
+          of the plan with the throughput and the unfilled lines. Invalid
+          lines are skipped and counted in the summary.
+
+    Note:
+    The lines are allocated in file order from the cached search index, and
+    a record is allocated to one line at most. No order is placed.
+    """
+    started = time.perf_counter()
+    reader = RecordReader(path, "orders", format, skip_invalid=True)
+    planner = AllocationPlanner(
+        aggregates.get("search_index"), policy, partial, held_records()
+    )
+    for result in planner.plan(reader):
+        yield {"command": "allocate", **result}
+
+    summary = planner.summary()
+    summary["invalid"] = reader.rejected
+    summary["problems"] = reader.problems
+    record_action(
+        "allocate",
+        f"Allocated {summary['allocated']} items to {summary['lines']} order lines",
+        started,
+        policy=policy,
+        lines=summary["lines"],
+        allocated=summary["allocated"],
+    )
+    yield {"command": "allocate", "policy": policy, "summary": summary}
+
+
+def build_parser():
+    """
+    Build the command line parser of the tool.
+
+    Returns:
+    argparse.ArgumentParser: A parser with one subcommand per operation.
+                             Without a subcommand the interactive menu is run.
+    """
+    parser = argparse.ArgumentParser(
+        description="Query the warehouse stock. Results are written as JSON Lines."
+    )
+    parser.add_argument(
+        "--snapshot",
+        default=os.environ.get(SNAPSHOT_ENV),
+        help=f"load the data from a snapshot file instead of data.py "
+        f"(default: ${SNAPSHOT_ENV})",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=os.environ.get(PROCESSES_ENV),
+        help=f"count the warehouses with this many worker processes "
+        f"(default: ${PROCESSES_ENV})",
+    )
+    parser.add_argument(
+        "--journal",
+        default=os.environ.get(JOURNAL_ENV),
+        help=f"append every search and order to this file (default: ${JOURNAL_ENV})",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=os.environ.get(METRICS_ENV),
+        help=f'write latency histograms and counters to this file, or "-" for '
+        f"standard error, when the session ends (default: ${METRICS_ENV})",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=os.environ.get(PROFILE_ENV, "").lower() in {"1", "true", "yes"},
+        help=f"add a cProfile summary to the metrics (default: ${PROFILE_ENV})",
+    )
+    parser.add_argument(
+        "--views",
+        default=os.environ.get(VIEWS_ENV),
+        help=f"keep the warehouse grouping, category counts and category numbers "
+        f"in this file between runs (default: ${VIEWS_ENV})",
+    )
+    parser.add_argument(
+        "--database",
+        default=os.environ.get(DATABASE_ENV),
+        help=f"read the data from an SQLite database written by database.py "
+        f"(default: ${DATABASE_ENV})",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    interactive_parser = subparsers.add_parser(
+        "interactive", help="run the interactive menu (default)"
+    )
+    interactive_parser.add_argument(
+        "--no-pager",
+        action="store_true",
+        help="list all items without waiting after each page",
+    )
+    parser.set_defaults(no_pager=False)
+
+    list_parser = subparsers.add_parser("list", help="list items by warehouse")
+    list_parser.add_argument("--warehouse", type=int, help="only list this warehouse")
+
+    search_parser = subparsers.add_parser("search", help="search an item")
+    search_parser.add_argument("item", nargs="+", help='e.g. "Elegant GPS"')
+
+    suggest_parser = subparsers.add_parser(
+        "suggest", help="complete or correct an item name"
+    )
+    suggest_parser.add_argument("item", nargs="+", help='e.g. "elegant g"')
+    suggest_parser.add_argument("--limit", type=int, default=5)
+
+    browse_parser = subparsers.add_parser("browse", help="browse by category")
+    browse_parser.add_argument("category", nargs="+", help="category name or number")
+
+    aging_parser = subparsers.add_parser(
+        "aging", help="list the items in stock for the longest time"
+    )
+    aging_group = aging_parser.add_mutually_exclusive_group(required=True)
+    aging_group.add_argument(
+        "--older-than",
+        type=non_negative_int,
+        metavar="DAYS",
+        help="items older than DAYS days",
+    )
+    aging_group.add_argument(
+        "--oldest", type=non_negative_int, metavar="N", help="N oldest items"
+    )
+    aging_parser.add_argument("--warehouse", type=int, help="only this warehouse")
+    aging_parser.add_argument("--category", help="only this category, name or number")
+    aging_parser.add_argument(
+        "--limit",
+        type=non_negative_int,
+        default=100,
+        help="most items listed by --older-than",
+    )
+
+    crosstab_parser = subparsers.add_parser(
+        "crosstab", help="count the items by two of warehouse, category and state"
+    )
+    crosstab_parser.add_argument("--rows", choices=AXES, default="warehouse")
+    crosstab_parser.add_argument("--columns", choices=AXES, default="category")
+    crosstab_parser.add_argument("--warehouse", type=int, help="only this warehouse")
+    crosstab_parser.add_argument(
+        "--category", help="only this category, name or number"
+    )
+    crosstab_parser.add_argument("--state", help="only this state")
+
+    order_parser = subparsers.add_parser("order", help="order an item")
+    order_parser.add_argument("item", nargs="+", help='e.g. "Elegant GPS"')
+    order_parser.add_argument("--amount", type=int, required=True)
+    order_parser.add_argument("--user", required=True, help="employee user name")
+    order_parser.add_argument("--password", required=True)
+    order_parser.add_argument(
+        "--max",
+        action="store_true",
+        help="order the maximum available if the amount is not in stock",
+    )
+
+    allocate_parser = subparsers.add_parser(
+        "allocate", help="plan which stock records ship a file of order lines"
+    )
+    allocate_parser.add_argument(
+        "file", help='CSV or JSON Lines order lines, or "-" for standard input'
+    )
+    allocate_parser.add_argument("--policy", choices=POLICIES, default="fifo")
+    allocate_parser.add_argument(
+        "--all-or-nothing",
+        action="store_true",
+        help="leave a line unallocated unless it can be filled",
+    )
+    allocate_parser.add_argument(
+        "--format", choices=FORMATS, help="default: by extension"
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="run one query per line from a file"
+    )
+    batch_parser.add_argument(
+        "file", help='file with one query per line, or "-" for standard input'
+    )
+
+    return parser
+
+
+def run_query(args):
+    """
+    Yield the results of one parsed, non-interactive query.
+
+    Parameters:
+    - args (argparse.Namespace): The parsed `list`, `search`, `browse`
+                                 or `order` command.
+
+    Yields:
+    dict: The JSON serializable results of the query.
+    """
+    if args.command == "list":
+        yield from list_results(args.warehouse)
+    elif args.command == "search":
+        started = time.perf_counter()
+        result = search_results(" ".join(args.item))
+        record_action("search", f"Searched {result['item']}", started)
+        yield result
+    elif args.command == "suggest":
+        item = " ".join(args.item)
+        yield {
+            "command": "suggest",
+            "item": item,
+            "suggestions": item_suggestions(item, limit=args.limit),
+        }
+    elif args.command == "browse":
+        yield browse_results(" ".join(args.category))
+    elif args.command == "aging":
+        yield aging_results(
+            args.older_than, args.oldest, args.warehouse, args.category, args.limit
+        )
+    elif args.command == "crosstab":
+        yield crosstab_results(
+            args.rows, args.columns, args.warehouse, args.category, args.state
+        )
+    elif args.command == "order":
+        yield order_results(
+            " ".join(args.item), args.amount, args.user, args.password, args.max
+        )
+    elif args.command == "allocate":
+        yield from allocation_results(
+            args.file, args.policy, not args.all_or_nothing, args.format
+        )
+
+
+def write_json_lines(results, output):
+    """Write each result as one JSON line as soon as it is produced."""
+    for result in results:
+        output.write(json.dumps(result) + "\n")
+
+
+def run_batch(lines, parser, output):
+    """
+    Run one query per line and stream the results as JSON Lines.
+
+    Parameters:
+    - lines (iterable): Queries written like the command line, e.g.
+                        `search Elegant GPS`. Blank lines and lines starting
+                        with "#" are skipped.
+    - parser (argparse.ArgumentParser): The parser returned by `build_parser()`.
+    - output (file): Where the results are written.
+
+    Note:
+    The output is flushed after every query, so the tool can be driven
+    line by line through a pipe. A query that fails, e.g. on a file that
+    cannot be read, is reported as an error and the next queries still run.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(line))
+        except (SystemExit, ValueError):
+            args = None
+        if args is None or args.command not in QUERY_COMMANDS:
+            output.write(json.dumps({"query": line, "error": "Invalid query"}) + "\n")
+        else:
+            try:
+                write_json_lines(run_query(args), output)
+            except (OSError, ValueError) as error:
+                # e.g. a missing order file: the following queries still run
+                output.write(json.dumps({"query": line, "error": str(error)}) + "\n")
+        output.flush()
+
+
+def main(argv=None):
     """
     Entry point for the warehouse management program.
 
-    This function performs the following steps:
+    Without a subcommand, or with `interactive`, this function performs
+    the following steps:
     1. Fetches the user's name.
     2. Greets the user.
     3. Presents options for interacting with the warehouse system.
 
-    Returns:
-    None. The function interacts with the user
-    via print statements and input prompts.
-    """
-    user_name = get_user_name()
-    print(greet(user_name))
-    options(user_name)
+    The other subcommands run a single query, or a file of queries with
+    `batch`, and write the results to standard output as JSON Lines.
+
+    With `--journal`, every action is also appended to a journal file, see
+    `journal.py`. With `--metrics` or `--profile`, the latency of every operation and of
+    its phases is collected and written as JSON once the session ends.
 
+    Parameters:
+    - argv (list, optional): The command line arguments. If not provided,
+                             `sys.argv` is used.
 
-main()
+    Returns:
+    None.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    load_data(args.snapshot, args.database)
+    use_processes(args.processes)
+    use_views(args.views)
+    report = args.metrics
+    if report is None and args.profile:
+        report = "-"
+    if report is not None:
+        metrics.enable(profile=args.profile)
+    use_journal(args.journal)
+
+    try:
+        if args.command in (None, "interactive"):
+            user_name = get_user_name()
+            print(greet(user_name))
+            options(user_name, pager=not args.no_pager)
+        else:
+            # queries and orders are journaled under the account running them
+            session.journal = SessionJournal(getpass.getuser(), journal_writer)
+            if args.command == "batch":
+                if args.file == "-":
+                    run_batch(sys.stdin, parser, sys.stdout)
+                else:
+                    with open(args.file) as lines:
+                        run_batch(lines, parser, sys.stdout)
+            else:
+                try:
+                    write_json_lines(run_query(args), sys.stdout)
+                except (OSError, ValueError) as error:
+                    sys.exit(str(error))
+    finally:
+        session.journal = None
+        use_journal(None)
+        if report is not None:
+            metrics.dump(report, command=args.command, cache=aggregates.stats())
+
+
+if __name__ == "__main__":
+    main()
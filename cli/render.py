@@ -0,0 +1,62 @@
+import sys
+from store import StockSelection
+
+
+def page_view(records, start, stop):
+    """
+    Return the records of one page without copying them.
+
+    Parameters:
+    - records (StockSelection or list): The records of a warehouse, or any
+                                        selection with a `view()` method,
+                                        e.g. a `DatabaseSelection`.
+    - start (int): The position of the first record of the page.
+    - stop (int): The position after the last record of the page.
+
+    Returns:
+    The view of the selection, or an iterator over the list items.
+    """
+    if hasattr(records, "view"):
+        return records.view(start, stop)
+    return (records[index] for index in range(start, min(stop, len(records))))
+
+
+def format_page(records, first_number=1):
+    """
+    Format numbered "state category" lines for a page of records.
+
+    Parameters:
+    - records (iterable): The records of the page.
+    - first_number (int, default=1): The number of the first record.
+
+    Returns:
+    str: One line per record, e.g. "1. High quality USB hub".
+    """
+    if isinstance(records, StockSelection):
+        store = records.store
+        states = store.dictionaries["state"]
+        categories = store.dictionaries["category"]
+        state_column = store.columns["state"]
+        category_column = store.columns["category"]
+        return "".join(
+            f"{number}. {states[state_column[index]]} {categories[category_column[index]]}\n"
+            for number, index in enumerate(records.indices, first_number)
+        )
+    return "".join(
+        f"{number}. {dct['state']} {dct['category']}\n"
+        for number, dct in enumerate(records, first_number)
+    )
+
+
+def write_page(records, first_number=1, output=None):
+    """
+    Write a page of records with a single call.
+
+    Parameters:
+    - records (iterable): The records of the page.
+    - first_number (int, default=1): The number of the first record.
+    - output (file, optional): Where to write. Defaults to `sys.stdout`.
+    """
+    if output is None:
+        output = sys.stdout
+    output.write(format_page(records, first_number))
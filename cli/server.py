@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import query
+from metrics import metrics
+
+
+class SessionStream:
+    """
+    Stand in for `sys.stdin` or `sys.stdout` and route each thread to its own stream.
+
+    Parameters:
+    - default (file): The stream used by threads that are not serving a session.
+
+    Note:
+    `print()` and `input()` always use `sys.stdout` and `sys.stdin`. Installing
+    one `SessionStream` for each lets the unchanged interactive functions talk
+    to the client of the session running in the current thread.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def attach(self, stream):
+        self.local.stream = stream
+
+    def detach(self):
+        self.local.__dict__.pop("stream", None)
+
+    def __getattr__(self, name):
+        return getattr(getattr(self.local, "stream", self.default), name)
+
+
+class ConnectionStream:
+    """
+    A text stream over an asyncio connection, used from a session thread.
+
+    Parameters:
+    - reader (asyncio.StreamReader): The client's input.
+    - writer (asyncio.StreamWriter): The client's output.
+    - loop (asyncio.AbstractEventLoop): The loop serving the connection.
+    """
+
+    def __init__(self, reader, writer, loop):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+
+    def fileno(self):
+        # not a terminal: makes `input()` use `readline()` and `write()`
+        raise io.UnsupportedOperation("fileno")
+
+    def readline(self, size=-1):
+        line = asyncio.run_coroutine_threadsafe(
+            self.reader.readline(), self.loop
+        ).result()
+        return line.decode("utf-8", errors="replace")
+
+    def write(self, text):
+        self.loop.call_soon_threadsafe(self.writer.write, text.encode("utf-8"))
+        return len(text)
+
+    def flush(self):
+        asyncio.run_coroutine_threadsafe(self.writer.drain(), self.loop).result()
+
+
+def run_session(stream):
+    """
+    Run the interactive menu for one client, in the calling thread.
+
+    Parameters:
+    - stream (ConnectionStream): The connection of the client.
+    """
+    sys.stdin.attach(stream)
+    sys.stdout.attach(stream)
+    metrics.count("sessions")
+    try:
+        user_name = query.get_user_name()
+        print(query.greet(user_name))
+        query.options(user_name)
+    except (EOFError, ConnectionError):
+        pass
+    finally:
+        sys.stdout.detach()
+        sys.stdin.detach()
+
+
+async def serve(host, port, max_sessions):
+    """
+    Serve the interactive menu to every client connecting to `host`:`port`.
+
+    Parameters:
+    - host (str): The address to listen on.
+    - port (int): The port to listen on.
+    - max_sessions (int): The number of sessions served at the same time.
+                          Further clients wait for a free session.
+
+    Note:
+    Every session runs the functions of `query.py` in its own thread and
+    shares the data, indexes and order ledger loaded once by the server.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_sessions)
+
+    async def handle(reader, writer):
+        stream = ConnectionStream(reader, writer, loop)
+        try:
+            await loop.run_in_executor(executor, run_session, stream)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    addresses = ", ".join(str(sock.getsockname()) for sock in server.sockets)
+    print(f"Serving on {addresses}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    """Load the data once and start the server."""
+    parser = argparse.ArgumentParser(
+        description="Serve the warehouse menu to many clients at once."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-sessions", type=int, default=256)
+    parser.add_argument(
+        "--snapshot",
+        default=os.environ.get(query.SNAPSHOT_ENV),
+        help=f"load the data from a snapshot file instead of data.py "
+        f"(default: ${query.SNAPSHOT_ENV})",
+    )
+    parser.add_argument(
+        "--database",
+        default=os.environ.get(query.DATABASE_ENV),
+        help=f"read the data from an SQLite database written by database.py "
+        f"(default: ${query.DATABASE_ENV})",
+    )
+    parser.add_argument(
+        "--journal", help="append the actions of every session to this file"
+    )
+    parser.add_argument(
+        "--metrics", help="write the latencies of every session here on shutdown"
+    )
+    parser.add_argument(
+        "--views",
+        default=os.environ.get(query.VIEWS_ENV),
+        help=f"keep the warehouse grouping, category counts and category numbers "
+        f"in this file between runs (default: ${query.VIEWS_ENV})",
+    )
+    args = parser.parse_args(argv)
+
+    query.load_data(args.snapshot, args.database)
+    query.use_views(args.views)
+    # build the shared indexes before the first client connects
+    query.aggregates.get("search_index")
+    query.order_ledger()
+    query.use_journal(args.journal)
+
+    sys.stdin = SessionStream(sys.stdin)
+    sys.stdout = SessionStream(sys.stdout)
+    if args.metrics is not None:
+        metrics.enable()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_sessions))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        query.use_journal(None)
+        if args.metrics is not None:
+            metrics.dump(args.metrics, cache=query.aggregates.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import compress
+from multiprocessing import shared_memory
+
+SHARDED_FIELDS = ("warehouse", "state", "category")
+MIN_SHARD_ROWS = 100_000
+# turns the `removed` flags of a store into "keep" flags
+KEEP = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+def count_rows(warehouses, states, categories, removed=None):
+    """
+    Count the records of each warehouse, state and category.
+
+    Parameters:
+    - warehouses (sequence): The warehouse column.
+    - states (sequence): The state codes.
+    - categories (sequence): The category codes.
+    - removed (sequence, optional): The `removed` flags of the records.
+
+    Returns:
+    Counter: The number of records of each (warehouse, state code,
+             category code) triple, in order of first appearance.
+    """
+    rows = zip(warehouses, states, categories)
+    if removed is not None:
+        rows = compress(rows, bytes(removed).translate(KEEP))
+    return Counter(rows)
+
+
+def count_shard(name, layout, start, stop):
+    """
+    Count the rows `start` to `stop` of columns held in shared memory.
+
+    Parameters:
+    - name (str): The name of the shared memory block.
+    - layout (list): The (offset, size, typecode) of each column in the block.
+    - start (int): The first row of the shard.
+    - stop (int): The row after the last one of the shard.
+
+    Returns:
+    Counter: The counts of `count_rows()` for the shard.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    views = [
+        memory.buf[offset : offset + size].cast(typecode)[start:stop]
+        for offset, size, typecode in layout
+    ]
+    try:
+        return count_rows(*views)
+    finally:
+        for view in views:
+            view.release()
+        memory.close()
+
+
+class ShardedCounter:
+    """
+    Count the stock of every warehouse with a pool of worker processes.
+
+    Parameters:
+    - processes (int, optional): The number of workers. If not provided,
+                                 one per CPU.
+    - min_rows (int, default=MIN_SHARD_ROWS): Stores with fewer records are
+                                              counted in the calling process.
+
+    Note:
+    The columns are copied once into a shared memory block, so the workers
+    read them without pickling. Each worker counts a contiguous range of
+    records, which keeps the shards even however the records are spread
+    over the warehouses, and returns counts keyed by warehouse. The parent
+    merges the partial counts in record order, so the result is the same
+    as a single pass over the store.
+    """
+
+    def __init__(self, processes=None, min_rows=MIN_SHARD_ROWS):
+        self.processes = processes or os.cpu_count() or 1
+        self.min_rows = min_rows
+        self.pool = None
+
+    def count(self, stock):
+        """
+        Count the records of each warehouse, state and category.
+
+        Parameters:
+        - stock (ColumnarStock): The store to count.
+
+        Returns:
+        Counter: The counts of `count_rows()` for the whole store.
+        """
+        size = len(stock.columns["warehouse"])
+        columns = [stock.columns[field] for field in SHARDED_FIELDS]
+        if stock.removed_count:
+            columns.append(stock.removed)
+        if self.processes < 2 or size < self.min_rows:
+            return count_rows(*columns)
+
+        raw = [memoryview(column).cast("B") for column in columns]
+        layout = []
+        offset = 0
+        for column, data in zip(columns, raw):
+            layout.append((offset, data.nbytes, memoryview(column).format))
+            offset += -(-data.nbytes // 8) * 8
+
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.processes)
+        memory = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        try:
+            for (start, length, _), data in zip(layout, raw):
+                memory.buf[start : start + length] = data
+            step = -(-size // self.processes)
+            shards = [
+                self.pool.submit(
+                    count_shard, memory.name, layout, start, min(start + step, size)
+                )
+                for start in range(0, size, step)
+            ]
+            counts = Counter()
+            for shard in shards:
+                counts.update(shard.result())
+        finally:
+            for data in raw:
+                data.release()
+            memory.close()
+            memory.unlink()
+        return counts
+
+    def close(self):
+        """Stop the worker processes."""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+def count_by_warehouse(stock, counter=None):
+    """
+    Count the products of each state and category in each warehouse.
+
+    Parameters:
+    - stock (ColumnarStock): The store to count.
+    - counter (ShardedCounter, optional): The pool doing the counting. If not
+                                          provided, the store is counted in
+                                          the calling process.
+
+    Returns:
+    dict: A dictionary mapping each warehouse number, in order of first
+          appearance, to a dictionary of (state, category) pairs and their
+          amounts.
+    """
+    if counter is None:
+        counts = ShardedCounter(1).count(stock)
+    else:
+        counts = counter.count(stock)
+
+    states = stock.dictionaries["state"]
+    categories = stock.dictionaries["category"]
+    warehouses = {}
+    for (warehouse, state, category), amount in counts.items():
+        products = warehouses.get(warehouse)
+        if products is None:
+            products = warehouses[warehouse] = {}
+        products[(states[state], categories[category])] = amount
+    return warehouses
@@ -0,0 +1,152 @@
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+from itertools import islice
+from store import ColumnarStock, FIELDS
+
+MAGIC = b"WHSNAP01"
+HEADER = struct.Struct("<8sQ")
+ALIGNMENT = 8
+CHUNK_SIZE = 100_000
+
+
+def write_snapshot(path, stock, personnel, chunk_size=CHUNK_SIZE):
+    """
+    Compile the stock and personnel data into a binary snapshot file.
+
+    Parameters:
+    - path (str): The file to write.
+    - stock (ColumnarStock or iterable): The stock store, or an iterable of
+                                         stock dictionaries to encode first.
+    - personnel (list): The nested personnel list.
+    - chunk_size (int, default=CHUNK_SIZE): The records encoded at once when
+                                            `stock` has to be encoded.
+
+    Returns:
+    int: The number of stock records written.
+
+    Note:
+    The file starts with a small JSON header holding the dictionaries of the
+    encoded fields, the personnel list and the position of every column.
+    The columns follow as raw, 8 byte aligned integer arrays, so that they
+    can be memory mapped by `load_snapshot()` without being decoded.
+    Records that are not in a `ColumnarStock` are encoded chunk by chunk
+    into temporary column files next to `path`, so they are never all held
+    in memory.
+    """
+    if isinstance(stock, ColumnarStock) and not stock.removed_count:
+        with open(path, "wb") as file:
+            write_header(file, len(stock), stock.dictionaries, personnel)
+            for field in FIELDS:
+                file.write(stock.columns[field])
+        return len(stock)
+
+    # removed records are left out
+    directory = os.path.dirname(os.path.abspath(path))
+    spools = {field: tempfile.TemporaryFile(dir=directory) for field in FIELDS}
+    try:
+        encoder = ColumnarStock()
+        records = iter(stock)
+        rows = 0
+        while True:
+            encoder.extend(islice(records, chunk_size))
+            if not len(encoder):
+                break
+            for field in FIELDS:
+                spools[field].write(encoder.columns[field])
+            rows += len(encoder)
+            # the dictionaries are kept, so codes stay the same across chunks
+            encoder.columns = {field: array("q") for field in FIELDS}
+            encoder.removed = bytearray()
+
+        with open(path, "wb") as file:
+            write_header(file, rows, encoder.dictionaries, personnel)
+            for field in FIELDS:
+                spools[field].seek(0)
+                shutil.copyfileobj(spools[field], file, 1 << 20)
+    finally:
+        for spool in spools.values():
+            spool.close()
+    return rows
+
+
+def write_header(file, rows, dictionaries, personnel):
+    columns = {}
+    offset = 0
+    for field in FIELDS:
+        columns[field] = {"offset": offset, "typecode": "q"}
+        offset += rows * array("q").itemsize
+
+    metadata = json.dumps(
+        {
+            "rows": rows,
+            "byteorder": sys.byteorder,
+            "columns": columns,
+            "dictionaries": dictionaries,
+            "personnel": personnel,
+        }
+    ).encode("utf-8")
+    metadata += b" " * (-(HEADER.size + len(metadata)) % ALIGNMENT)
+    file.write(HEADER.pack(MAGIC, len(metadata)))
+    file.write(metadata)
+
+
+def load_snapshot(path):
+    """
+    Open a snapshot written by `write_snapshot()`.
+
+    Parameters:
+    - path (str): The snapshot file.
+
+    Returns:
+    tuple: The `ColumnarStock` and the personnel list.
+
+    Note:
+    Only the header is read. The columns are memory mapped and read by the
+    operating system as records are accessed, so opening a snapshot takes
+    the same time whatever the number of records. The store is copied into
+    memory the first time a record is added to it.
+    """
+    with open(path, "rb") as file:
+        magic, metadata_size = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a stock snapshot")
+        metadata = json.loads(file.read(metadata_size))
+        if metadata["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {metadata['byteorder']} machine")
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    start = HEADER.size + metadata_size
+    buffer = memoryview(data)
+    columns = {}
+    for field, column in metadata["columns"].items():
+        begin = start + column["offset"]
+        end = begin + metadata["rows"] * struct.calcsize(column["typecode"])
+        columns[field] = buffer[begin:end].cast(column["typecode"])
+
+    stock = ColumnarStock.from_columns(columns, metadata["dictionaries"])
+    return stock, metadata["personnel"]
+
+
+def main(argv=None):
+    """Compile `data.py` into a snapshot file given on the command line."""
+    parser = argparse.ArgumentParser(
+        description="Compile the stock and personnel of data.py into a snapshot."
+    )
+    parser.add_argument("output", help="the snapshot file to write")
+    args = parser.parse_args(argv)
+
+    from data import stock, personnel
+
+    rows = write_snapshot(args.output, stock, personnel)
+    print(f"Wrote {rows} items to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
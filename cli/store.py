@@ -0,0 +1,466 @@
+import time
+from array import array
+from collections import Counter
+from itertools import compress
+from collections.abc import Mapping
+from datetime import datetime as dt, timedelta
+
+ENCODED_FIELDS = ("state", "category")
+NUMERIC_FIELDS = ("warehouse",)
+DATE_FIELDS = ("date_of_stock",)
+FIELDS = ("state", "category", "warehouse", "date_of_stock")
+
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+EPOCH = dt(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def to_epoch(date):
+    """
+    Convert a naive datetime or a `DATE_FORMAT` string to epoch seconds.
+
+    Parameters:
+    - date (datetime or str): The date to convert.
+
+    Returns:
+    int: The whole number of seconds since 1970-01-01 00:00:00.
+    """
+    if isinstance(date, str):
+        date = dt.fromisoformat(date)
+    return (date - EPOCH) // ONE_SECOND
+
+
+def from_epoch(seconds):
+    """
+    Format epoch seconds back into a `DATE_FORMAT` string.
+
+    Parameters:
+    - seconds (int): The number of seconds since 1970-01-01 00:00:00.
+
+    Returns:
+    str: The date as it is written in the stock data.
+    """
+    # `time.gmtime()` is several times faster than datetime arithmetic
+    return time.strftime(DATE_FORMAT, time.gmtime(seconds))
+
+
+def days_in_stock(records, reference=None):
+    """
+    Compute how many days each record has been in stock.
+
+    Parameters:
+    - records (iterable): A `StockSelection`, or any iterable of stock
+                          dictionaries.
+    - reference (datetime, optional): The moment the ages are measured at.
+                                      If not provided, `datetime.today()`
+                                      is used once for all the records.
+
+    Returns:
+    list: The number of whole days in stock of each record, in order.
+
+    Note:
+    For a `StockSelection` the ages are computed from the pre-parsed epoch
+    column, so no date is parsed during the call.
+    """
+    if reference is None:
+        reference = dt.today()
+    now = to_epoch(reference)
+
+    if isinstance(records, StockSelection):
+        dates = records.store.columns["date_of_stock"]
+        return [(now - dates[index]) // SECONDS_PER_DAY for index in records.indices]
+    if hasattr(records, "epochs"):
+        # e.g. a `DatabaseSelection`, which reads the stored epoch dates
+        return [(now - date) // SECONDS_PER_DAY for date in records.epochs()]
+    return [
+        (now - to_epoch(dct["date_of_stock"])) // SECONDS_PER_DAY for dct in records
+    ]
+
+
+class StockRow(Mapping):
+    """
+    A read-only, dict-like view of a single record of a `ColumnarStock`.
+
+    Parameters:
+    - store (ColumnarStock): The store holding the record.
+    - index (int): The position of the record in the store.
+
+    Note:
+    Rows are created on demand while iterating and only keep a reference
+    to the store, so the values are decoded each time a key is accessed.
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.store.value(key, self.index)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class StockSelection:
+    """
+    An ordered subset of the records of a `ColumnarStock`.
+
+    Parameters:
+    - store (ColumnarStock): The store holding the records.
+    - indices (array, optional): Positions of the selected records.
+                                 If not provided, an empty selection is created.
+
+    Note:
+    Selections behave like the lists of dictionaries they replace: they
+    support `len()`, iteration, indexing and slicing.
+    """
+
+    __slots__ = ("store", "indices")
+
+    def __init__(self, store, indices=None):
+        self.store = store
+        self.indices = array("q") if indices is None else indices
+
+    def append(self, row):
+        self.indices.append(row.index)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        store = self.store
+        for index in self.indices:
+            yield StockRow(store, index)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return StockSelection(self.store, self.indices[position])
+        return StockRow(self.store, self.indices[position])
+
+    def view(self, start, stop):
+        """
+        Return a read-only selection of a range of records, without copying.
+
+        Parameters:
+        - start (int): The position of the first record.
+        - stop (int): The position after the last record.
+
+        Returns:
+        StockSelection: A selection sharing the indices of this one.
+        """
+        return StockSelection(self.store, memoryview(self.indices)[start:stop])
+
+    def without(self, positions):
+        """
+        Leave records out of the selection.
+
+        Parameters:
+        - positions (container): The positions in the store of the records
+                                 to leave out, e.g. a set.
+
+        Returns:
+        StockSelection: A new selection of the other records, in order.
+        """
+        return StockSelection(
+            self.store,
+            array("q", (index for index in self.indices if index not in positions)),
+        )
+
+
+class LiveSelection(StockSelection):
+    """
+    A `StockSelection` whose records can be added and removed one by one.
+
+    Parameters:
+    - store (ColumnarStock): The store holding the records.
+    - indices (iterable, optional): Positions of the selected records.
+
+    Note:
+    The records are kept in an insertion ordered dictionary, so adding or
+    removing a record is a dictionary operation. The array of indices used
+    for positional access is rebuilt lazily, in O(n), by the first access
+    after a change, and turning a plain selection into a `LiveSelection`
+    copies its positions once, also in O(n).
+    """
+
+    __slots__ = ("members", "cached")
+
+    def __init__(self, store, indices=()):
+        self.store = store
+        self.members = dict.fromkeys(indices)
+        self.cached = None
+
+    @property
+    def indices(self):
+        if self.cached is None:
+            self.cached = array("q", self.members)
+        return self.cached
+
+    def append(self, row):
+        self.members[row.index] = None
+        self.cached = None
+
+    def discard(self, index):
+        """Remove the record at position `index` of the store, if selected."""
+        if self.members.pop(index, False) is None:
+            self.cached = None
+
+    def __len__(self):
+        return len(self.members)
+
+    def __iter__(self):
+        store = self.store
+        for index in self.members:
+            yield StockRow(store, index)
+
+
+class ColumnarStock:
+    """
+    A compact, column oriented replacement for the `stock` list of dictionaries.
+
+    Every field is kept in its own array. The string fields are dictionary
+    encoded: each distinct value is stored once and the column only holds
+    its integer code. Dates are parsed once and stored as epoch seconds.
+
+    Note:
+    Iterating the store yields `StockRow` objects that can be read like the
+    original dictionaries, e.g. `row["category"]`. The `version` counter is
+    increased on every change so that derived structures can be cached.
+    Removed records keep their position, so that the positions held by
+    selections stay valid, and are skipped by iteration and counting.
+    """
+
+    def __init__(self):
+        self.columns = {field: array("q") for field in FIELDS}
+        self.dictionaries = {field: [] for field in ENCODED_FIELDS}
+        self.codes = {field: {} for field in ENCODED_FIELDS}
+        self.removed = bytearray()
+        self.removed_count = 0
+        self.version = 0
+
+    @classmethod
+    def from_columns(cls, columns, dictionaries):
+        """
+        Build a store over existing columns, without copying them.
+
+        Parameters:
+        - columns (dict): One integer sequence per field, e.g. arrays or
+                          memory mapped views.
+        - dictionaries (dict): The values of each encoded field, in code order.
+
+        Returns:
+        ColumnarStock: A store reading the given columns.
+        """
+        store = cls()
+        store.columns = dict(columns)
+        store.removed = bytearray(len(store.columns["warehouse"]))
+        for field in ENCODED_FIELDS:
+            store.dictionaries[field] = list(dictionaries[field])
+            store.codes[field] = {
+                value: code for code, value in enumerate(store.dictionaries[field])
+            }
+        return store
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build a store from an iterable of stock dictionaries.
+
+        Parameters:
+        - records (iterable): Dictionaries with the keys `state`, `category`,
+                              `warehouse` and `date_of_stock`.
+
+        Returns:
+        ColumnarStock: A new store holding the records in the same order.
+        """
+        store = cls()
+        store.extend(records)
+        return store
+
+    def encode(self, field, value):
+        """
+        Return the integer code of a value, registering it if it is new.
+
+        Parameters:
+        - field (str): The name of a dictionary encoded field.
+        - value (str): The value to encode.
+
+        Returns:
+        int: The code of the value. Codes follow the order of first appearance.
+        """
+        codes = self.codes[field]
+        code = codes.get(value)
+        if code is None:
+            code = len(codes)
+            codes[value] = code
+            self.dictionaries[field].append(value)
+        return code
+
+    def make_writable(self):
+        if not isinstance(self.columns["warehouse"], array):
+            # columns given to `from_columns()` may be read-only views
+            self.columns = {
+                field: array("q", column) for field, column in self.columns.items()
+            }
+
+    def append(self, record):
+        self.make_writable()
+        for field in ENCODED_FIELDS:
+            self.columns[field].append(self.encode(field, record[field]))
+        for field in NUMERIC_FIELDS:
+            self.columns[field].append(record[field])
+        for field in DATE_FIELDS:
+            self.columns[field].append(to_epoch(record[field]))
+        self.removed.append(0)
+        self.version += 1
+
+    def update(self, index, field, value):
+        """
+        Change one field of one record.
+
+        Parameters:
+        - index (int): The position of the record.
+        - field (str): The name of the field.
+        - value: The new value, as it would be written in `data.py`.
+        """
+        self.make_writable()
+        if field in ENCODED_FIELDS:
+            value = self.encode(field, value)
+        elif field in DATE_FIELDS:
+            value = to_epoch(value)
+        elif field not in self.columns:
+            raise KeyError(field)
+        self.columns[field][index] = value
+        self.version += 1
+
+    def remove(self, index):
+        """
+        Remove the record at a position.
+
+        Parameters:
+        - index (int): The position of the record.
+        """
+        if self.removed[index]:
+            raise KeyError(f"stock record {index} is already removed")
+        self.removed[index] = 1
+        self.removed_count += 1
+        self.version += 1
+
+    def live(self, column):
+        """Return the values of a column, skipping removed records."""
+        if not self.removed_count:
+            return column
+        return compress(column, (not flag for flag in self.removed))
+
+    def extend(self, records):
+        # `append()` unrolled, as stores are built from millions of records
+        self.make_writable()
+        columns = self.columns
+        states, categories = columns["state"], columns["category"]
+        warehouses, dates = columns["warehouse"], columns["date_of_stock"]
+        encode = self.encode
+        added = 0
+        try:
+            for record in records:
+                states.append(encode("state", record["state"]))
+                categories.append(encode("category", record["category"]))
+                warehouses.append(record["warehouse"])
+                dates.append(to_epoch(record["date_of_stock"]))
+                added += 1
+        finally:
+            self.removed.extend(bytes(added))
+            self.version += added
+
+    def value(self, field, index):
+        """
+        Decode the value of one field of one record.
+
+        Parameters:
+        - field (str): The name of the field.
+        - index (int): The position of the record.
+
+        Returns:
+        The decoded value, as it was in the original dictionary.
+        """
+        if field in self.dictionaries:
+            return self.dictionaries[field][self.columns[field][index]]
+        if field in DATE_FIELDS:
+            return from_epoch(self.columns[field][index])
+        if field in self.columns:
+            return self.columns[field][index]
+        raise KeyError(field)
+
+    def group_by(self, field):
+        """
+        Group the records by the value of a field.
+
+        Parameters:
+        - field (str): The name of the field to group by.
+
+        Returns:
+        dict: A dictionary mapping each value, in order of first appearance,
+              to a `StockSelection` of its records.
+        """
+        groups = {}
+        for index, code in enumerate(self.columns[field]):
+            if self.removed_count and self.removed[index]:
+                continue
+            indices = groups.get(code)
+            if indices is None:
+                indices = groups[code] = array("q")
+            indices.append(index)
+
+        values = self.dictionaries.get(field)
+        return {
+            code if values is None else values[code]: StockSelection(self, indices)
+            for code, indices in groups.items()
+        }
+
+    def count_by(self, field):
+        """
+        Count the records for each value of a field.
+
+        Parameters:
+        - field (str): The name of the field to count.
+
+        Returns:
+        dict: A dictionary mapping each value, in order of first appearance,
+              to its number of records.
+        """
+        counts = Counter(self.live(self.columns[field]))
+
+        values = self.dictionaries.get(field)
+        if values is None:
+            return dict(counts)
+        return {values[code]: amount for code, amount in counts.items()}
+
+    def __len__(self):
+        return len(self.columns["warehouse"]) - self.removed_count
+
+    def __iter__(self):
+        for index in self.live(range(len(self.columns["warehouse"]))):
+            yield StockRow(self, index)
+
+    def __getitem__(self, position):
+        # positions include removed records, like `StockRow.index`
+        size = len(self.columns["warehouse"])
+        if isinstance(position, slice):
+            return StockSelection(self, array("q", range(size)[position]))
+        if position < 0:
+            position += size
+        if not 0 <= position < size:
+            raise IndexError("stock index out of range")
+        return StockRow(self, position)
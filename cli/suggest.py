@@ -0,0 +1,168 @@
+from bisect import bisect_left
+from collections import Counter
+
+CANDIDATES = 50
+
+
+def trigrams(text):
+    """
+    Split a text into overlapping groups of three characters.
+
+    Parameters:
+    - text (str): The text, already lowercased.
+
+    Returns:
+    set: The trigrams of the text padded with spaces, so that short words
+         and word boundaries are represented too.
+    """
+    padded = f"  {text} "
+    return {padded[start : start + 3] for start in range(len(padded) - 2)}
+
+
+def edit_distance(first, second, limit):
+    """
+    Count the single character edits turning one text into another.
+
+    Parameters:
+    - first (str): The first text.
+    - second (str): The second text.
+    - limit (int): Stop counting once the distance is known to exceed it.
+
+    Returns:
+    int: The Levenshtein distance, or `limit + 1` if it is above `limit`.
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+
+    previous = list(range(len(second) + 1))
+    for row, first_char in enumerate(first, 1):
+        current = [row]
+        for column, second_char in enumerate(second, 1):
+            current.append(
+                min(
+                    previous[column] + 1,
+                    current[column - 1] + 1,
+                    previous[column - 1] + (first_char != second_char),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class ItemSuggester:
+    """
+    Complete and correct item names.
+
+    Parameters:
+    - names (iterable): The distinct lowercased "state category" names.
+
+    Note:
+    Completions come from a sorted list of the names, searched with
+    bisection. Misspelled names are matched through a trigram index: the
+    names sharing most trigrams with the query are ranked by edit distance.
+    """
+
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        self.words = sorted(
+            (word_start, name)
+            for name in self.names
+            for word_start in self.word_starts(name)
+        )
+        self.index = {}
+        for name in self.names:
+            for trigram in trigrams(name):
+                self.index.setdefault(trigram, []).append(name)
+
+    @staticmethod
+    def word_starts(name):
+        """Yield the name from the start of each of its words but the first."""
+        for position, char in enumerate(name):
+            if char == " ":
+                yield name[position + 1 :]
+
+    def complete(self, prefix, limit=10):
+        """
+        List the names starting with a prefix.
+
+        Parameters:
+        - prefix (str): The beginning of a name, in any case.
+        - limit (int, default=10): The maximum number of names.
+
+        Returns:
+        list: Names starting with `prefix`, then names where a later word
+              starts with it, e.g. "usb" completes to "high quality usb hub".
+        """
+        prefix = prefix.lower()
+        completions = []
+        position = bisect_left(self.names, prefix)
+        while (
+            len(completions) < limit
+            and position < len(self.names)
+            and self.names[position].startswith(prefix)
+        ):
+            completions.append(self.names[position])
+            position += 1
+
+        position = bisect_left(self.words, (prefix,))
+        while (
+            len(completions) < limit
+            and position < len(self.words)
+            and self.words[position][0].startswith(prefix)
+        ):
+            name = self.words[position][1]
+            if name not in completions:
+                completions.append(name)
+            position += 1
+        return completions
+
+    def fuzzy(self, text, limit=5, max_distance=None):
+        """
+        List the names closest to a possibly misspelled one.
+
+        Parameters:
+        - text (str): The name as typed, in any case.
+        - limit (int, default=5): The maximum number of names.
+        - max_distance (int, optional): The most edits allowed. If not
+                                        provided, one edit per three
+                                        characters, and at least one.
+
+        Returns:
+        list: Names ordered by edit distance, closest first.
+        """
+        text = text.lower()
+        if max_distance is None:
+            max_distance = max(1, len(text) // 3)
+
+        shared = Counter()
+        for trigram in trigrams(text):
+            shared.update(self.index.get(trigram, ()))
+
+        ranked = []
+        for name, _ in shared.most_common(CANDIDATES):
+            distance = edit_distance(text, name, max_distance)
+            if distance <= max_distance:
+                ranked.append((distance, name))
+        ranked.sort()
+        return [name for _, name in ranked[:limit]]
+
+    def suggest(self, text, limit=5):
+        """
+        List completions of a text, then close matches.
+
+        Parameters:
+        - text (str): The name as typed, in any case.
+        - limit (int, default=5): The maximum number of names.
+
+        Returns:
+        list: The suggested names, without duplicates.
+        """
+        suggestions = self.complete(text, limit)
+        for name in self.fuzzy(text, limit):
+            if len(suggestions) >= limit:
+                break
+            if name not in suggestions:
+                suggestions.append(name)
+        return suggestions
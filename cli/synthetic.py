@@ -0,0 +1,152 @@
+import argparse
+import random
+import string
+from array import array
+from store import ColumnarStock, to_epoch
+
+STATES = [
+    "High quality",
+    "Exceptional",
+    "Elegant",
+    "Original",
+    "Red",
+    "Brand new",
+    "Black",
+    "Funny",
+    "Second hand",
+    "Cheap",
+    "Wireless",
+    "Almost new",
+    "White",
+    "Blue",
+]
+CATEGORIES = [
+    "USB hub",
+    "iOS charger",
+    "GPS",
+    "Monitor",
+    "Beamer",
+    "Router",
+    "Smartphone",
+    "Camera",
+    "Keyboard",
+    "Remote control",
+    "Game console",
+    "Printer",
+    "HDMI cable",
+    "Microphone",
+    "Headphones",
+    "Laptop",
+    "Speakers",
+    "Scanner",
+    "Surveillance camera",
+    "Mouse",
+    "Smart TV",
+    "Pen drive",
+    "Television",
+    "Smartwatch",
+    "Home-cinema",
+    "Tablet",
+]
+FIRST_DATE = "2019-08-10 00:00:00"
+LAST_DATE = "2021-10-07 23:59:59"
+CHUNK_SIZE = 1_000_000
+
+
+def generate_stock(rows, warehouses=4, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    Generate a random stock with the same shape as `data.py`.
+
+    Parameters:
+    - rows (int): The number of stock records.
+    - warehouses (int, default=4): Records are spread over warehouses 1 to
+                                   `warehouses`.
+    - seed (int, default=0): Seed of the random generator.
+    - chunk_size (int, default=1000000): Records generated per step, which
+                                         bounds the temporary memory used.
+
+    Returns:
+    ColumnarStock: A store with random states, categories, warehouses and
+                   dates between `FIRST_DATE` and `LAST_DATE`.
+    """
+    generator = random.Random(seed)
+    first = to_epoch(FIRST_DATE)
+    last = to_epoch(LAST_DATE)
+    columns = {
+        "state": array("q"),
+        "category": array("q"),
+        "warehouse": array("q"),
+        "date_of_stock": array("q"),
+    }
+
+    for start in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - start)
+        columns["state"].extend(generator.choices(range(len(STATES)), k=size))
+        columns["category"].extend(generator.choices(range(len(CATEGORIES)), k=size))
+        columns["warehouse"].extend(generator.choices(range(1, warehouses + 1), k=size))
+        columns["date_of_stock"].extend(
+            generator.randint(first, last) for _ in range(size)
+        )
+
+    return ColumnarStock.from_columns(
+        columns, {"state": STATES, "category": CATEGORIES}
+    )
+
+
+def generate_personnel(depth=3, width=3, seed=0):
+    """
+    Generate a personnel tree of the same shape as `data.py`.
+
+    Parameters:
+    - depth (int, default=3): The number of levels of the tree.
+    - width (int, default=3): The number of employees at the top level and
+                              under every head, except at the last level.
+    - seed (int, default=0): Seed of the random passwords.
+
+    Returns:
+    list: The nested personnel list, with `width ** level` employees at each
+          level. User names are unique: "employee1", "employee2", ...
+    """
+    generator = random.Random(seed)
+    personnel = []
+    count = 0
+    # each entry is a list to fill and the level of its employees
+    stack = [(personnel, 1)] if depth > 0 else []
+    while stack:
+        employees, level = stack.pop()
+        for _ in range(width):
+            count += 1
+            employee = {
+                "user_name": f"employee{count}",
+                "password": "".join(generator.choices(string.ascii_lowercase, k=8)),
+            }
+            employees.append(employee)
+            if level < depth:
+                employee["head_of"] = []
+                stack.append((employee["head_of"], level + 1))
+    return personnel
+
+
+def main(argv=None):
+    """Write a synthetic dataset as a snapshot file."""
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic stock and personnel snapshot."
+    )
+    parser.add_argument("output", help="the snapshot file to write")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--warehouses", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=3, help="personnel levels")
+    parser.add_argument("--width", type=int, default=3, help="employees per head")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from snapshot import write_snapshot
+
+    stock = generate_stock(args.rows, args.warehouses, args.seed)
+    personnel = generate_personnel(args.depth, args.width, args.seed)
+    write_snapshot(args.output, stock, personnel)
+    print(f"Wrote {len(stock)} items in {args.warehouses} warehouses to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
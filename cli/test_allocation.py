@@ -0,0 +1,104 @@
+import random
+import unittest
+
+from allocation import AllocationPlanner
+from query import build_search_index
+from store import ColumnarStock, to_epoch
+
+ITEMS = [("Cheap", "GPS"), ("Red", "Router")]
+DATES = ["2020-01-01 00:00:00", "2020-01-02 00:00:00", "2020-01-03 00:00:00"]
+
+
+def random_stock(seed, size=300):
+    """A stock of few items and dates, so most records share their date."""
+    chooser = random.Random(seed)
+    records = []
+    for _ in range(size):
+        state, category = chooser.choice(ITEMS)
+        records.append(
+            {
+                "state": state,
+                "category": category,
+                "warehouse": chooser.randint(1, 4),
+                "date_of_stock": chooser.choice(DATES),
+            }
+        )
+    return ColumnarStock.from_records(records)
+
+
+class BruteForce:
+    """Allocate by sorting every remaining unit, as the policies should."""
+
+    def __init__(self, stock, index, policy, partial=True, held=()):
+        self.index = index
+        self.dates = stock.columns["date_of_stock"]
+        self.policy = policy
+        self.partial = partial
+        self.taken = set(held)
+
+    def allocate(self, item, amount, warehouse=None):
+        postings = self.index.get(item, {})
+        units = []
+        for rank, (number, records) in enumerate(postings.items()):
+            if warehouse not in (None, number):
+                continue
+            for position in records.indices:
+                if position in self.taken:
+                    continue
+                date = self.dates[position]
+                if self.policy == "fifo":
+                    units.append(((date, rank, position), position))
+                else:
+                    units.append(((-date, rank, -position), position))
+        if not self.partial and len(units) < amount:
+            return set()
+        chosen = {position for _, position in sorted(units)[:amount]}
+        self.taken |= chosen
+        return chosen
+
+
+def allocated(shipments):
+    return {position for shipment in shipments for position in shipment["records"]}
+
+
+class AllocationPlannerTest(unittest.TestCase):
+    def compare(self, policy, partial=True, held=(), seed=0):
+        stock = random_stock(seed)
+        index = build_search_index(stock.group_by("warehouse"))
+        planner = AllocationPlanner(index, policy, partial, set(held) or None)
+        expected = BruteForce(stock, index, policy, partial, held)
+        chooser = random.Random(seed)
+        for _ in range(60):
+            item = " ".join(chooser.choice(ITEMS)).lower()
+            amount = chooser.randint(1, 12)
+            warehouse = chooser.choice([None, None, 1, 2, 3, 4])
+            shipments = planner.allocate(item, amount, warehouse)
+            self.assertEqual(
+                allocated(shipments), expected.allocate(item, amount, warehouse)
+            )
+            for shipment in shipments:
+                self.assertIn(warehouse, (None, shipment["warehouse"]))
+                dates = [to_epoch(shipment["oldest"]), to_epoch(shipment["newest"])]
+                self.assertEqual(dates, sorted(dates))
+
+    def test_oldest_first_takes_ties_in_warehouse_order(self):
+        for seed in range(5):
+            self.compare("fifo", seed=seed)
+
+    def test_newest_first_takes_ties_in_warehouse_order(self):
+        for seed in range(5):
+            self.compare("lifo", seed=seed)
+
+    def test_lines_that_cannot_be_filled_get_nothing(self):
+        for seed in range(5):
+            self.compare("fifo", partial=False, seed=seed)
+            self.compare("lifo", partial=False, seed=seed)
+
+    def test_held_records_are_not_allocated(self):
+        held = range(0, 300, 3)
+        self.compare("fifo", held=held)
+        self.compare("lifo", partial=False, held=held)
+
+
+if __name__ == "__main__":
+    unittest.main()
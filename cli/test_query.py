@@ -0,0 +1,91 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+import query
+
+
+def run_interactive(function, answers, *args):
+    """Call an interactive function with scripted answers, returning its output."""
+    output = io.StringIO()
+    with mock.patch("builtins.input", side_effect=answers):
+        with contextlib.redirect_stdout(output):
+            function(*args)
+    return output.getvalue()
+
+
+class OrderedStockTest(unittest.TestCase):
+    def setUp(self):
+        # a fresh stock and order ledger for every test
+        query.load_data()
+
+    def test_ordered_units_leave_every_view(self):
+        item = "elegant gps"
+        before = query.search_results(item)
+        self.assertEqual(before["total"], 23)
+
+        ordered = query.order_results(item, 20, "Jeremy", "coppers")
+        self.assertEqual(ordered["ordered"], 20)
+
+        after = query.search_results(item)
+        self.assertEqual(after["total"], 3)
+        for warehouse in after["warehouses"]:
+            self.assertEqual(warehouse["amount"], len(warehouse["days_in_stock"]))
+
+        listed = [
+            result
+            for result in query.list_results()
+            if result.get("item", "").lower() == item
+        ]
+        self.assertEqual(len(listed), 3)
+
+        browsed = query.browse_results("GPS")
+        self.assertEqual(
+            sum(w["products"].get("Elegant GPS", 0) for w in browsed["warehouses"]),
+            3,
+        )
+        oldest = query.aging_results(oldest=10_000, category="GPS")
+        self.assertEqual(oldest["total"], browsed["total"])
+        self.assertEqual(
+            sum(row["item"] == "Elegant GPS" for row in oldest["items"]), 3
+        )
+        older = query.aging_results(older_than=0, category="GPS", limit=None)
+        self.assertEqual(older["total"], browsed["total"])
+        crosstab = query.crosstab_results("state", "category", category="GPS")
+        self.assertEqual(crosstab["table"]["Elegant"]["GPS"], 3)
+        self.assertEqual(crosstab["total"], browsed["total"])
+
+    def test_search_lists_the_units_left(self):
+        query.order_results("elegant gps", 23, "Jeremy", "coppers")
+        output = run_interactive(query.searching_for_item, ["elegant gps"], "Bob")
+        self.assertNotIn("in stock for", output)
+        self.assertIn("Location: Not in stock", output)
+
+
+class BrowseTest(unittest.TestCase):
+    def setUp(self):
+        query.load_data()
+        # numbers kept from a run where a category, now gone, was number 1
+        counts = query.aggregates.get("category_counts")
+        query.category_numbers = {"Gone": 1}
+        query.category_numbers.update(
+            (category, number) for number, category in enumerate(counts, start=2)
+        )
+        query.aggregates.values.pop("numeric_categories", None)
+
+    def tearDown(self):
+        query.category_numbers = {}
+        query.aggregates.values.pop("numeric_categories", None)
+
+    def test_numbers_not_in_the_menu_are_asked_again(self):
+        output = run_interactive(
+            query.browse_by_category, ["1", "99", "2", "", "", "", ""], "Bob"
+        )
+        self.assertIn("1 is not a category number", output)
+        self.assertIn("99 is not a category number", output)
+        self.assertIn("in all warehouses", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import io
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import query
+import server
+
+
+class ScriptedStream(io.StringIO):
+    """The connection of a client typing `answers`, keeping what it is sent."""
+
+    def __init__(self, answers):
+        super().__init__()
+        self.answers = io.StringIO(answers)
+
+    def readline(self, size=-1):
+        return self.answers.readline(size)
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        # a fresh stock and order ledger, whatever the other tests ordered
+        query.load_data()
+        self.stdin, self.stdout = sys.stdin, sys.stdout
+        sys.stdin = server.SessionStream(sys.stdin)
+        sys.stdout = server.SessionStream(sys.stdout)
+
+    def tearDown(self):
+        sys.stdin, sys.stdout = self.stdin, self.stdout
+
+    def test_sessions_on_one_worker_authenticate_each(self):
+        first = ScriptedStream("Alice\n2\nelegant gps\ny\nJeremy\ncoppers\n1\n5\n")
+        second = ScriptedStream("mallory\n2\nelegant gps\ny\n1\n5\n")
+        # one worker serves both sessions, one after the other
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(server.run_session, first).result()
+            executor.submit(server.run_session, second).result()
+
+        self.assertIn("1 elegant gps have been ordered", first.getvalue())
+        self.assertIn("*** Enter the user name ***", second.getvalue())
+        self.assertNotIn("have been ordered", second.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
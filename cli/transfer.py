@@ -0,0 +1,561 @@
+import argparse
+import csv
+import gzip
+import json
+import sys
+from datetime import datetime as dt, timezone
+from itertools import islice
+from store import ColumnarStock, FIELDS, StockSelection, from_epoch
+
+CHUNK_SIZE = 10_000
+FORMATS = ("csv", "jsonl")
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+PERSONNEL_FIELDS = ("user_name", "password", "level")
+MAX_PROBLEMS = 20
+
+
+def file_format(path, format=None):
+    """
+    Tell the format of a file from its name.
+
+    Parameters:
+    - path (str): The file name, possibly ending in ".gz".
+    - format (str, optional): "csv" or "jsonl". If provided, it is returned.
+
+    Returns:
+    str: "csv" or "jsonl". The standard streams, "-", default to "jsonl".
+    """
+    if format is not None:
+        if format not in FORMATS:
+            raise ValueError(f"unknown format {format!r}")
+        return format
+    if path == "-":
+        return "jsonl"
+    name = path.lower().removesuffix(".gz")
+    for extension, detected in EXTENSIONS.items():
+        if name.endswith(extension):
+            return detected
+    raise ValueError(f"cannot tell the format of {path}, use csv or jsonl")
+
+
+def open_text(path, mode):
+    """Open a text file, "-" for the standard streams, decompressing ".gz" files."""
+    if path == "-":
+        stream = sys.stdin if mode == "r" else sys.stdout
+        # closing the returned file leaves the standard stream open
+        return open(stream.fileno(), mode, encoding="utf-8", newline="", closefd=False)
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="", buffering=1 << 20)
+
+
+def text(row, field):
+    value = row.get(field)
+    if value is None:
+        raise ValueError(f"missing {field}")
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string, not {value!r}")
+    value = value.strip()
+    if not value:
+        raise ValueError(f"empty {field}")
+    return value
+
+
+def integer(row, field):
+    value = row.get(field)
+    if value is None or value == "":
+        raise ValueError(f"missing {field}")
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"{field} must be a whole number, not {value!r}") from None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError(f"{field} must be a whole number, not {value!r}")
+
+
+def parse_date(value, date_format=None):
+    """
+    Parse a stock date.
+
+    Parameters:
+    - value (str or int): An ISO 8601 date, e.g. "2021-10-07 12:00:00",
+                          "2021-10-07T12:00:00Z" or "2021-10-07", or epoch
+                          seconds.
+    - date_format (str, optional): A `strptime()` format used instead of
+                                   ISO 8601 for strings.
+
+    Returns:
+    datetime: A naive date, in UTC when `value` had a time zone, without
+              fractions of a second.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        date = dt.fromtimestamp(value, timezone.utc)
+    elif not isinstance(value, str):
+        raise ValueError(f"date_of_stock must be a date, not {value!r}")
+    else:
+        value = value.strip()
+        try:
+            if date_format is None:
+                date = dt.fromisoformat(value)
+            else:
+                date = dt.strptime(value, date_format)
+        except ValueError:
+            raise ValueError(f"date_of_stock is not a valid date: {value!r}") from None
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    if date.microsecond:
+        date = date.replace(microsecond=0)
+    return date
+
+
+def normalize_stock(row, date_format=None):
+    """
+    Validate and normalize one stock record.
+
+    Parameters:
+    - row (dict): The fields as read from the file.
+    - date_format (str, optional): See `parse_date()`.
+
+    Returns:
+    dict: A stock dictionary with stripped names, an integer warehouse and
+          a parsed `date_of_stock`. Other fields are dropped.
+    """
+    date = row.get("date_of_stock")
+    if date is None or date == "":
+        raise ValueError("missing date_of_stock")
+    return {
+        "state": text(row, "state"),
+        "category": text(row, "category"),
+        "warehouse": integer(row, "warehouse"),
+        "date_of_stock": parse_date(date, date_format),
+    }
+
+
+def normalize_employee(row, date_format=None):
+    """
+    Validate and normalize one employee.
+
+    Parameters:
+    - row (dict): The fields as read from the file. `level` is the depth of
+                  the employee in the personnel tree, 0 at the top, and
+                  defaults to 0.
+    - date_format: Not used.
+
+    Returns:
+    dict: The `user_name`, `password` and `level` of the employee.
+    """
+    level = 0 if row.get("level") in (None, "") else integer(row, "level")
+    if level < 0:
+        raise ValueError(f"level must not be negative, not {level}")
+    return {
+        "user_name": text(row, "user_name"),
+        "password": text(row, "password"),
+        "level": level,
+    }
+
+
+def normalize_order(row, date_format=None):
+    """
+    Validate and normalize one order line.
+
+    Parameters:
+    - row (dict): The fields as read from the file: the `order` it belongs
+                  to, the "state category" `item`, the `amount` wanted and
+                  optionally the only `warehouse` to ship from.
+    - date_format: Not used.
+
+    Returns:
+    dict: The order line, with a lowercased item and a positive amount.
+    """
+    order = row.get("order")
+    if isinstance(order, int) and not isinstance(order, bool):
+        row = dict(row, order=str(order))
+    amount = integer(row, "amount")
+    if amount <= 0:
+        raise ValueError(f"amount must be positive, not {amount}")
+    warehouse = row.get("warehouse")
+    return {
+        "order": text(row, "order"),
+        "item": text(row, "item").lower(),
+        "amount": amount,
+        "warehouse": None if warehouse in (None, "") else integer(row, "warehouse"),
+    }
+
+
+NORMALIZERS = {
+    "stock": normalize_stock,
+    "personnel": normalize_employee,
+    "orders": normalize_order,
+}
+
+
+class RecordReader:
+    """
+    Read, validate and normalize the records of a CSV or JSON Lines file.
+
+    Parameters:
+    - path (str): The file, or "-" for the standard input. Files ending in
+                  ".gz" are decompressed as they are read.
+    - kind (str, default="stock"): "stock", "personnel" or "orders".
+    - format (str, optional): "csv" or "jsonl". If not provided, it is told
+                              by the extension of `path`.
+    - chunk_size (int, default=CHUNK_SIZE): The most records per chunk.
+    - skip_invalid (bool, default=False): Skip invalid records instead of
+                                          raising a ValueError.
+    - date_format (str, optional): See `parse_date()`.
+
+    Note:
+    The file is read line by line and handed out in lists of at most
+    `chunk_size` records, so the memory used does not depend on the size
+    of the file. CSV files need a header line naming the fields. After
+    reading, `read` is the number of records read, `rejected` the number of
+    invalid ones and `problems` the first `MAX_PROBLEMS` errors.
+    """
+
+    def __init__(
+        self,
+        path,
+        kind="stock",
+        format=None,
+        chunk_size=CHUNK_SIZE,
+        skip_invalid=False,
+        date_format=None,
+    ):
+        self.path = path
+        self.normalize = NORMALIZERS[kind]
+        self.format = file_format(path, format)
+        self.chunk_size = chunk_size
+        self.skip_invalid = skip_invalid
+        self.date_format = date_format
+        self.read = 0
+        self.rejected = 0
+        self.problems = []
+
+    def rows(self, file):
+        """Yield the line number and the raw fields of every record of a file."""
+        if self.format == "csv":
+            reader = csv.reader(file)
+            header = [name.strip() for name in next(reader, ())]
+            for row in reader:
+                if row:
+                    yield reader.line_num, dict(zip(header, row))
+            return
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row
+
+    def records(self):
+        """Yield the normalized records, one at a time."""
+        normalize = self.normalize
+        date_format = self.date_format
+        with open_text(self.path, "r") as file:
+            for number, row in self.rows(file):
+                self.read += 1
+                try:
+                    if not isinstance(row, dict):
+                        raise ValueError("not a JSON object")
+                    yield normalize(row, date_format)
+                except ValueError as error:
+                    problem = f"{self.path}, line {number}: {error}"
+                    if not self.skip_invalid:
+                        raise ValueError(problem) from None
+                    self.rejected += 1
+                    if len(self.problems) < MAX_PROBLEMS:
+                        self.problems.append(problem)
+
+    def chunks(self):
+        """
+        Yield the normalized records in chunks.
+
+        Yields:
+        list: At most `chunk_size` records, in file order.
+        """
+        records = self.records()
+        while True:
+            chunk = list(islice(records, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+
+def build_personnel(employees):
+    """
+    Rebuild the nested personnel list from employees listed depth first.
+
+    Parameters:
+    - employees (iterable): Dictionaries as returned by
+                            `normalize_employee()`, each one following its
+                            head or a colleague of the same head.
+
+    Returns:
+    list: The nested personnel list. Subordinates are under `head_of`.
+    """
+    personnel = []
+    # the heads of the last employee, from the top
+    heads = []
+    for employee in employees:
+        level = employee.pop("level")
+        if level > len(heads):
+            raise ValueError(
+                f"{employee['user_name']} is at level {level} but has no head "
+                f"at level {level - 1}"
+            )
+        del heads[level:]
+        if heads:
+            heads[-1].setdefault("head_of", []).append(employee)
+        else:
+            personnel.append(employee)
+        heads.append(employee)
+    return personnel
+
+
+def flatten_personnel(personnel):
+    """
+    List the employees of the nested personnel list, depth first.
+
+    Parameters:
+    - personnel (list): The nested personnel list.
+
+    Yields:
+    tuple: The user name, password and level of each employee.
+    """
+    stack = [(dct, 0) for dct in reversed(personnel)]
+    while stack:
+        dct, level = stack.pop()
+        yield dct["user_name"], dct["password"], level
+        for subordinate in reversed(dct.get("head_of", ())):
+            stack.append((subordinate, level + 1))
+
+
+def stock_rows(records):
+    """
+    Yield the fields of stock records, in `FIELDS` order.
+
+    Parameters:
+    - records (iterable): A `ColumnarStock`, a `StockSelection` or any
+                          iterable of stock dictionaries.
+
+    Yields:
+    tuple: The state, category, warehouse and date of each record.
+
+    Note:
+    The columns of a `ColumnarStock` are decoded directly, without creating
+    a `StockRow` per record.
+    """
+    if isinstance(records, StockSelection):
+        store, indices = records.store, records.indices
+    elif isinstance(records, ColumnarStock):
+        store = records
+        indices = store.live(range(len(store.columns["warehouse"])))
+    else:
+        for record in records:
+            date = record["date_of_stock"]
+            if isinstance(date, dt):
+                date = date.isoformat(" ")
+            yield (record["state"], record["category"], record["warehouse"], date)
+        return
+
+    states = store.dictionaries["state"]
+    categories = store.dictionaries["category"]
+    columns = store.columns
+    for index in indices:
+        yield (
+            states[columns["state"][index]],
+            categories[columns["category"][index]],
+            columns["warehouse"][index],
+            from_epoch(columns["date_of_stock"][index]),
+        )
+
+
+def write_rows(path, fields, rows, format=None, chunk_size=CHUNK_SIZE):
+    """
+    Write rows of values to a CSV or JSON Lines file.
+
+    Parameters:
+    - path (str): The file, or "-" for the standard output. Files ending in
+                  ".gz" are compressed.
+    - fields (tuple): The names of the values of each row.
+    - rows (iterable): Tuples of values.
+    - format (str, optional): "csv" or "jsonl". If not provided, it is told
+                              by the extension of `path`.
+    - chunk_size (int, default=CHUNK_SIZE): The rows written at once.
+
+    Returns:
+    int: The number of rows written.
+    """
+    format = file_format(path, format)
+    rows = iter(rows)
+    written = 0
+    with open_text(path, "w") as file:
+        if format == "csv":
+            writer = csv.writer(file, lineterminator="\n")
+            writer.writerow(fields)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            if format == "csv":
+                writer.writerows(chunk)
+            else:
+                file.write(
+                    "".join(json.dumps(dict(zip(fields, row))) + "\n" for row in chunk)
+                )
+            written += len(chunk)
+    return written
+
+
+def write_stock(path, records, format=None, chunk_size=CHUNK_SIZE):
+    """Export stock records, see `stock_rows()` and `write_rows()`."""
+    return write_rows(path, FIELDS, stock_rows(records), format, chunk_size)
+
+
+def write_personnel(path, personnel, format=None):
+    """Export the nested personnel list, see `flatten_personnel()`."""
+    return write_rows(path, PERSONNEL_FIELDS, flatten_personnel(personnel), format)
+
+
+def read_personnel(path, format=None, skip_invalid=False):
+    """
+    Import the personnel list written by `write_personnel()`.
+
+    Parameters:
+    - path (str): The file.
+    - format (str, optional): "csv" or "jsonl".
+    - skip_invalid (bool, default=False): Skip invalid employees.
+
+    Returns:
+    list: The nested personnel list.
+    """
+    return build_personnel(
+        RecordReader(path, "personnel", format, skip_invalid=skip_invalid)
+    )
+
+
+def import_data(stock_path, personnel_path, store=None, **options):
+    """
+    Import stock and personnel files into memory.
+
+    Parameters:
+    - stock_path (str): The stock file.
+    - personnel_path (str): The personnel file.
+    - store (ColumnarStock, optional): The store the records are added to.
+                                       If not provided, a new one is created.
+    - options: The options of `RecordReader`.
+
+    Returns:
+    tuple: The `ColumnarStock` and the personnel list, as expected by
+           `query.set_data()`.
+    """
+    if store is None:
+        store = ColumnarStock()
+    for chunk in RecordReader(stock_path, **options).chunks():
+        store.extend(chunk)
+    personnel = read_personnel(
+        personnel_path, skip_invalid=options.get("skip_invalid", False)
+    )
+    return store, personnel
+
+
+def report(reader, written, output):
+    print(f"Wrote {written} items to {output}")
+    if reader.rejected:
+        print(f"Skipped {reader.rejected} invalid records:", file=sys.stderr)
+        for problem in reader.problems:
+            print(f"  {problem}", file=sys.stderr)
+
+
+def main(argv=None):
+    """Import CSV or JSON Lines files into a snapshot or database, or export them."""
+    parser = argparse.ArgumentParser(
+        description="Move stock and personnel between CSV or JSON Lines files "
+        "and snapshots or databases."
+    )
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=FORMATS, help="default: by extension")
+    common.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser(
+        "import", parents=[common], help="read CSV or JSON Lines files"
+    )
+    importer.add_argument("stock", help='the stock file, or "-" for standard input')
+    importer.add_argument("personnel", help="the personnel file")
+    output = importer.add_mutually_exclusive_group(required=True)
+    output.add_argument("--snapshot", help="the snapshot file to write")
+    output.add_argument("--database", help="the database file to write")
+    importer.add_argument(
+        "--skip-invalid", action="store_true", help="skip invalid records"
+    )
+    importer.add_argument(
+        "--date-format", help='e.g. "%%d/%%m/%%Y %%H:%%M" (default: ISO 8601)'
+    )
+
+    exporter = commands.add_parser(
+        "export", parents=[common], help="write CSV or JSON Lines files"
+    )
+    exporter.add_argument("stock", help='the stock file, or "-" for standard output')
+    exporter.add_argument("--personnel", help="the personnel file to write")
+    source = exporter.add_mutually_exclusive_group()
+    source.add_argument("--snapshot", help="read a snapshot instead of data.py")
+    source.add_argument("--database", help="read a database instead of data.py")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        reader = RecordReader(
+            args.stock,
+            format=args.format,
+            chunk_size=args.chunk_size,
+            skip_invalid=args.skip_invalid,
+            date_format=args.date_format,
+        )
+        try:
+            personnel = read_personnel(args.personnel, args.format, args.skip_invalid)
+            if args.snapshot is not None:
+                from snapshot import write_snapshot
+
+                output = args.snapshot
+                written = write_snapshot(output, reader, personnel, args.chunk_size)
+            else:
+                from database import write_database
+
+                output = args.database
+                written = write_database(output, reader, personnel, args.chunk_size)
+        except ValueError as error:
+            # an invalid record, without --skip-invalid
+            sys.exit(str(error))
+        report(reader, written, output)
+        return
+
+    if args.snapshot is not None:
+        from snapshot import load_snapshot
+
+        stock, personnel = load_snapshot(args.snapshot)
+    elif args.database is not None:
+        from database import open_database
+
+        stock, personnel = open_database(args.database)
+    else:
+        from data import stock, personnel
+
+    written = write_stock(args.stock, stock, args.format, args.chunk_size)
+    if args.stock != "-":
+        print(f"Wrote {written} items to {args.stock}")
+    if args.personnel is not None:
+        write_personnel(args.personnel, personnel, args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+from array import array
+from store import FIELDS, StockSelection
+
+MAGIC = b"WHVIEW01"
+HEADER = struct.Struct("<8sQ")
+VIEWS = ("stock_by_warehouse", "category_counts", "numeric_categories")
+
+
+def checksum(stock):
+    """
+    Compute a checksum of the records of a store.
+
+    Parameters:
+    - stock (ColumnarStock or DatabaseStock): The store.
+
+    Returns:
+    str: A hexadecimal digest of the columns, the dictionaries and the
+         removed records, or None for a store without columns in memory.
+
+    Note:
+    The columns are hashed as raw buffers, so memory mapped snapshots are
+    hashed without being decoded, at the speed of reading the file.
+    """
+    if not hasattr(stock, "columns"):
+        return None
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(stock.dictionaries).encode("utf-8"))
+    for field in FIELDS:
+        digest.update(stock.columns[field])
+    digest.update(stock.removed)
+    return digest.hexdigest()
+
+
+def number_categories(counts, numbers):
+    """
+    Number the categories, keeping the numbers they were given before.
+
+    Parameters:
+    - counts (dict): The number of records of each category.
+    - numbers (dict): The number of each category numbered so far. New
+                      categories are added to it, numbered after the
+                      highest number.
+
+    Returns:
+    dict: A dictionary mapping each number to a list with its category and
+          count, as returned by `numeric_product_amount()`, in number order.
+          The numbers of categories that are out of stock are skipped.
+    """
+    highest = max(numbers.values(), default=0)
+    for category in counts:
+        if category not in numbers:
+            highest += 1
+            numbers[category] = highest
+    return {
+        numbers[category]: [category, counts[category]]
+        for category in sorted(counts, key=numbers.__getitem__)
+    }
+
+
+class ViewStore:
+    """
+    Keep materialized views of the stock in a file between runs.
+
+    Parameters:
+    - path (str): The file of the views. It is created if it is missing.
+
+    Note:
+    The file holds the warehouse grouping, the category counts and the
+    number of every category, with the checksum of the records they were
+    built from. When the checksum of the loaded records matches, the views
+    are put in the aggregate cache instead of being rebuilt. Otherwise they
+    are rebuilt in a background thread and the file is replaced. The
+    category numbers are kept even when the records change, so a category
+    has the same number in every run.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.numbers = {}
+        self.thread = None
+
+    def read(self):
+        """
+        Read the file.
+
+        Returns:
+        tuple: The metadata and the positions of the grouped records, or
+               (None, None) if the file is missing or unreadable.
+        """
+        try:
+            with open(self.path, "rb") as file:
+                magic, metadata_size = HEADER.unpack(file.read(HEADER.size))
+                if magic != MAGIC:
+                    return None, None
+                metadata = json.loads(file.read(metadata_size))
+                positions = array("q")
+                positions.frombytes(file.read())
+        except (OSError, ValueError, struct.error):
+            return None, None
+        return metadata, positions
+
+    def attach(self, stock, aggregates):
+        """
+        Load the views of a store into its cache, or rebuild them.
+
+        Parameters:
+        - stock (ColumnarStock or DatabaseStock): The loaded store.
+        - aggregates (AggregateCache): The cache of the store, with the
+                                       `VIEWS` registered.
+
+        Returns:
+        bool: True if the views were loaded, False if they are being rebuilt.
+        """
+        self.wait()
+        metadata, positions = self.read()
+        # the numbering is kept whatever records it was made for
+        self.numbers.clear()
+        if metadata is not None:
+            self.numbers.update(metadata["numbers"])
+        aggregates.values.pop("numeric_categories", None)
+
+        current = checksum(stock)
+        if (
+            metadata is not None
+            and current is not None
+            and metadata["checksum"] == current
+            and len(positions) == len(stock)
+        ):
+            self.install(stock, aggregates, metadata, positions)
+            return True
+
+        self.thread = threading.Thread(
+            target=self.rebuild, args=(stock, aggregates, current, stock.version)
+        )
+        self.thread.start()
+        return False
+
+    def install(self, stock, aggregates, metadata, positions):
+        groups = {}
+        start = 0
+        for warehouse, size in metadata["warehouses"]:
+            groups[warehouse] = StockSelection(stock, positions[start : start + size])
+            start += size
+        aggregates.put("stock_by_warehouse", groups)
+        aggregates.put("category_counts", dict(metadata["category_counts"]))
+
+    def rebuild(self, stock, aggregates, current, version):
+        views = {name: aggregates.get(name) for name in VIEWS}
+        contents = self.encode(current, views)
+        # views of records changed since the checksum would not match it
+        if stock.version == version:
+            self.save(contents)
+
+    def encode(self, current, views):
+        """
+        Serialize the views.
+
+        Parameters:
+        - current (str): The checksum of the records of the views, or None
+                         to only keep the category numbers.
+        - views (dict): The values of the `VIEWS`, by name.
+
+        Returns:
+        bytes: The contents of the file.
+        """
+        groups = views["stock_by_warehouse"]
+        if current is None or not all(
+            isinstance(group, StockSelection) for group in groups.values()
+        ):
+            # e.g. a `DatabaseStock`, whose groups are not held in memory
+            current, groups = None, {}
+        positions = [array("q", group.indices).tobytes() for group in groups.values()]
+        metadata = json.dumps(
+            {
+                "checksum": current,
+                # a copy, as sessions may number new categories meanwhile
+                "numbers": dict(self.numbers),
+                "category_counts": list(views["category_counts"].items()),
+                "warehouses": [
+                    [warehouse, len(part) // 8]
+                    for warehouse, part in zip(groups, positions)
+                ],
+            }
+        ).encode("utf-8")
+        return b"".join([HEADER.pack(MAGIC, len(metadata)), metadata, *positions])
+
+    def save(self, contents):
+        """Write the contents of the file, replacing it at once."""
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(contents)
+        os.replace(temporary, self.path)
+
+    def wait(self):
+        """Wait until a running rebuild has written the file."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None